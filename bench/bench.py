@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)bench.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+# Benchmarks of the intcode computer on the real inputs.
+#
+#   bench.py [<workload> ...] [--save] [--baseline <file>] [--threshold <t>] [--repeat <n>]
+#
+# Every workload is run once with a profiler attached to count instructions
+# and computer constructions, once while tracing allocations to get the peak
+# memory, and then --repeat times to get the wall time. The results are
+# compared against the baseline, and the run fails if any workload is more
+# than a fraction --threshold slower or larger, or gives a different answer.
+# With --save the baseline is overwritten instead.
+
+import itertools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,ROOT)
+from intcode import IntcodeComputer, HALTED, Profiler, run_batch, drain_records, load_program
+from intcode import jit
+
+# differences in wall time below this are considered noise
+MIN_TIME_DIFFERENCE = 0.02
+
+def run_noun_verb(computer,job):
+    computer.write(1,job[0])
+    computer.write(2,job[1])
+    computer.execute(deque(),deque())
+    return computer.mem.read(0)
+
+def day2(prog):
+    jobs = [(noun,verb) for noun in range(100) for verb in range(100)]
+    outputs = run_batch(prog,jobs,run=run_noun_verb)
+    noun,verb = jobs[outputs.index(19690720)]
+    return 100*noun+verb
+
+def run_with_input(prog,value):
+    output_pipe = deque()
+    IntcodeComputer(prog).execute(deque([value]),output_pipe)
+    return output_pipe[-1]
+
+def day5(prog):
+    return run_with_input(prog,5)
+
+def day7(prog):
+    template = IntcodeComputer(prog)
+    best = 0
+    for phase_settings in itertools.permutations(range(5,10)):
+        amplifiers = [template.fork() for _ in phase_settings]
+        pipes = [deque([phase]) for phase in phase_settings]
+        pipes[0].append(0)
+        while not amplifiers[-1].halted:
+            for i,amplifier in enumerate(amplifiers):
+                amplifier.execute(pipes[i],pipes[(i+1)%len(pipes)])
+        best = max(best,pipes[0][-1])
+    return best
+
+def day9(prog):
+    return run_with_input(prog,2)
+
+def day11(prog):
+    computer = IntcodeComputer(prog)
+    input_pipe = deque()
+    output_pipe = deque()
+    pos = (0,0)
+    direction = 0
+    panels = {pos: 1}
+    while True:
+        input_pipe.append(panels.get(pos,0))
+        computer.execute(input_pipe,output_pipe)
+        if computer.halted:
+            break
+        panels[pos],turn = output_pipe.popleft(),output_pipe.popleft()
+        direction = (direction + (1 if turn else -1)) % 4
+        dx,dy = [(0,1),(1,0),(0,-1),(-1,0)][direction]
+        pos = (pos[0]+dx,pos[1]+dy)
+    return len(panels)
+
+def day13(prog):
+    # a full game, with the paddle following the ball
+    computer = IntcodeComputer(prog)
+    computer.write(0,2)
+    input_pipe = deque()
+    output_pipe = deque()
+    score = 0
+    ball_x = paddle_x = 0
+    while True:
+        status = computer.execute(input_pipe,output_pipe)
+        for x,y,tile in drain_records(output_pipe,3):
+            if x == -1:
+                score = tile
+            elif tile == 3:
+                paddle_x = x
+            elif tile == 4:
+                ball_x = x
+        if status == HALTED:
+            return score
+        input_pipe.append((ball_x > paddle_x) - (ball_x < paddle_x))
+
+def day17(prog):
+    computer = IntcodeComputer(prog)
+    output_pipe = deque()
+    computer.execute(deque(),output_pipe)
+    rows = bytes(output_pipe).decode().split()
+    total = 0
+    for y in range(1,len(rows)-1):
+        for x in range(1,len(rows[y])-1):
+            if all(c == '#' for c in [rows[y][x],rows[y-1][x],rows[y+1][x],rows[y][x-1],rows[y][x+1]]):
+                total += x*y
+    return total
+
+def day19(prog):
+    outputs = run_batch(prog,[[x,y] for y in range(50) for x in range(50)],jit=True)
+    return sum(output[0] for output in outputs)
+
+def day21(prog):
+    instructions = (b'OR A T\n'
+                    b'AND B T\n'
+                    b'AND C T\n'
+                    b'NOT T J\n'
+                    b'AND D J\n'
+                    b'NOT E T\n'
+                    b'NOT T T\n'
+                    b'OR H T\n'
+                    b'AND T J\n'
+                    b'RUN\n')
+    output_pipe = deque()
+    IntcodeComputer(prog).execute(deque(instructions),output_pipe)
+    return output_pipe[-1]
+
+def day23(prog):
+    computers = []
+    input_pipes = []
+    for i in range(50):
+        computers.append(IntcodeComputer(prog))
+        input_pipes.append(deque([i]))
+    output_pipe = deque()
+    while True:
+        for computer,input_pipe in zip(computers,input_pipes):
+            if not input_pipe:
+                input_pipe.append(-1)
+            computer.execute(input_pipe,output_pipe)
+            for dest,x,y in drain_records(output_pipe,3):
+                if dest == 255:
+                    return y
+                input_pipes[dest].extend([x,y])
+
+WORKLOADS = [
+    ('day2',day2),
+    ('day5',day5),
+    ('day7',day7),
+    ('day9',day9),
+    ('day11',day11),
+    ('day13',day13),
+    ('day17',day17),
+    ('day19',day19),
+    ('day21',day21),
+    ('day23',day23),
+]
+
+def measure(workload,prog,repeat):
+    # counting run, with every computer profiled
+    profiler = Profiler()
+    IntcodeComputer.default_profiler = profiler
+    IntcodeComputer.nconstructed = 0
+    try:
+        result = workload(prog)
+    finally:
+        IntcodeComputer.default_profiler = None
+    constructions = IntcodeComputer.nconstructed
+
+    # separate run for the memory, so the profile is not included
+    jit.compiled_blocks.clear()
+    tracemalloc.start()
+    try:
+        workload(prog)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    # timed runs, each starting without any compiled blocks
+    wall_time = None
+    for r in range(repeat):
+        jit.compiled_blocks.clear()
+        t0 = time.perf_counter()
+        if workload(prog) != result:
+            raise Exception("Timed run of {} gave a different result".format(workload.__name__))
+        t = time.perf_counter() - t0
+        wall_time = t if wall_time is None else min(wall_time,t)
+
+    return {
+        'result': result,
+        'instructions': profiler.ninstructions(),
+        'wall_time': wall_time,
+        'peak_memory': peak_memory,
+        'constructions': constructions,
+    }
+
+def find_regressions(name,stats,base,threshold):
+    regressions = []
+    if stats['result'] != base['result']:
+        regressions.append("{}: result {} != {}".format(name,stats['result'],base['result']))
+    for key in ['wall_time','peak_memory','instructions','constructions']:
+        if key == 'wall_time' and stats[key]-base[key] < MIN_TIME_DIFFERENCE:
+            continue
+        if stats[key] > (1+threshold)*base[key]:
+            regressions.append("{}: {} {} > {}".format(name,key,stats[key],base[key]))
+    return regressions
+
+args = sys.argv[1:]
+
+baseline_file = os.path.join(ROOT,'bench','baseline.json')
+threshold = 0.25
+repeat = 3
+for flag in ['--baseline','--threshold','--repeat']:
+    if flag in args:
+        k = args.index(flag)
+        value = args[k+1]
+        del args[k:k+2]
+        if flag == '--baseline':
+            baseline_file = value
+        elif flag == '--threshold':
+            threshold = float(value)
+        else:
+            repeat = int(value)
+
+save = '--save' in args
+if save:
+    args.remove('--save')
+
+names = args if args else [name for name,_ in WORKLOADS]
+workloads = dict(WORKLOADS)
+for name in names:
+    if name not in workloads:
+        print("Unknown workload:",name)
+        sys.exit(1)
+
+baseline = {}
+if os.path.exists(baseline_file):
+    baseline = json.load(open(baseline_file))
+
+print("{:>8s} {:>10s} {:>12s} {:>10s} {:>10s} {:>5s} {:>10s}".format(
+    "workload","time (s)","instructions","Minstr/s","peak (kB)","VMs","vs base"))
+
+all_stats = {}
+regressions = []
+for name in names:
+    prog = load_program(os.path.join(ROOT,name,'input'))
+    stats = measure(workloads[name],prog,repeat)
+    all_stats[name] = stats
+
+    change = ""
+    if name in baseline:
+        base = baseline[name]
+        change = "{:+.1f}%".format(100*(stats['wall_time']/base['wall_time']-1))
+        regressions += find_regressions(name,stats,base,threshold)
+
+    print("{:>8s} {:10.3f} {:12d} {:10.2f} {:10.0f} {:5d} {:>10s}".format(
+        name,stats['wall_time'],stats['instructions'],
+        stats['instructions']/stats['wall_time']/1e6,
+        stats['peak_memory']/1000,stats['constructions'],change))
+
+if save:
+    baseline.update(all_stats)
+    with open(baseline_file,'w') as f:
+        json.dump(baseline,f,indent=2,sort_keys=True)
+        f.write("\n")
+    print("Saved baseline to",baseline_file)
+elif regressions:
+    print()
+    print("Regressions above {:.0f}%:".format(100*threshold))
+    for regression in regressions:
+        print("  "+regression)
+    sys.exit(1)
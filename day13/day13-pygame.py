@@ -4,8 +4,10 @@
 # @author Karl Ljungkvist <k.ljungkvist@gmail.com>
 
 
+import os
 import sys
 import time
+from collections import deque
 import pygame
 
 from pygame.locals import (
@@ -14,6 +16,7 @@ from pygame.locals import (
     K_LEFT,
     K_RIGHT,
     K_HOME,
+    K_END,
     K_PAGEUP,
     K_PAGEDOWN,
     K_ESCAPE,
@@ -21,173 +24,9 @@ from pygame.locals import (
     QUIT,
 )
 
-class Memory:
-    def __init__(self,state):
-        self.state = list(state)
-
-    def read(self,addr):
-        if addr < len(self.state):
-            return self.state[addr]
-        else:
-            return 0
-
-    def write(self,addr,data):
-        if addr >= len(self.state):
-            current_len = len(self.state)
-            missing = addr-(current_len-1)
-            self.state += [0]*missing
-        self.state[addr] = data
-
-    def __str__(self):
-        s = ""
-        nreps = 1
-        prev = None
-        for d in self.state:
-            if d == prev:
-                nreps += 1
-            elif nreps > 1:
-
-                s += " ... *{} ".format(nreps)
-                # also print the next entry
-                s += ", {}".format(d)
-                nreps = 1
-            else:
-                s += ", {}".format(d)
-
-            prev = d
-
-        return "["+s[1:].strip()+"]"
-
-
-class IntcodeComputer:
-    def __init__(self,state):
-        self.mem = Memory(state)
-        self.pc = 0
-        self.relative_base = 0
-        self.halted = False
-
-    def resolve_inarg(self,arg,opmode):
-        if opmode == 1:
-            return arg
-        elif opmode == 0:
-            return self.mem.read(arg)
-        elif opmode == 2:
-            return self.mem.read(self.relative_base + arg)
-        else:
-            return None
-
-    def resolve_outarg_addr(self,arg,opmode):
-        if opmode == 0:
-            return arg
-        elif opmode == 2:
-            return self.relative_base + arg
-        else:
-            return None
-
-    def execute(self, input_queue, output_queue):
-
-        if self.halted:
-            raise Exception("Cannot execute computer, already halted")
-
-        while True:
-
-            opcode = self.mem.read(self.pc) % 100
-            opmode = self.mem.read(self.pc) // 100
-
-            # print("pc: {}, opcode: {}, opmode: {}, relbase: {}, state: {}, output: {}".format(self.pc, opcode, opmode, self.relative_base, self.mem, output_queue))
-
-            if opcode == 99:
-                # halt
-                self.halted = True
-                break
-
-            if opcode in [1,2,7,8]:
-
-                if opcode == 1:
-                    # add
-                    operation = lambda a,b: a+b
-                elif opcode == 2:
-                    # multiply
-                    operation = lambda a,b: a*b
-                elif opcode == 7:
-                    # less-than
-                    operation = lambda a,b: 1 if a<b else 0
-                elif opcode == 8:
-                    # equals
-                    operation = lambda a,b: 1 if a==b else 0
-
-                in1 = self.mem.read(self.pc+1)
-                in2 = self.mem.read(self.pc+2)
-                out = self.mem.read(self.pc+3)
-
-                opmode1 = opmode % 10
-                opmode2 = (opmode//10) % 10
-                opmode3 = (opmode//100) % 10
-
-                arg1    = self.resolve_inarg(in1,opmode1)
-                arg2    = self.resolve_inarg(in2,opmode2)
-                outaddr = self.resolve_outarg_addr(out,opmode3)
-
-                self.mem.write(outaddr,operation(arg1,arg2))
-
-                self.pc += 4
-            elif opcode == 3:
-                # read input
-
-                out = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                outaddr = self.resolve_outarg_addr(out,opmode1)
-
-                if len(input_queue) == 0:
-                    # waiting for input...
-                    break
-
-                # have enough input
-                self.mem.write(outaddr,input_queue.pop(0))
-
-                self.pc += 2
-
-            elif opcode == 4:
-                # write output
-                in1 = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                arg1 = self.resolve_inarg(in1,opmode1)
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from intcode import IntcodeComputer, drain_records, load_program
 
-                output_queue.append(arg1)
-                self.pc += 2
-
-            elif opcode in [5,6]:
-                if opcode == 5:
-                    # jump-if-true
-                    cond = lambda a: a != 0
-                elif opcode == 6:
-                    # jump-if-false
-                    cond = lambda a: a == 0
-
-                in1 = self.mem.read(self.pc+1)
-                in2 = self.mem.read(self.pc+2)
-
-                opmode1 = opmode % 10
-                opmode2 = (opmode//10) % 10
-
-                arg1    = self.resolve_inarg(in1,opmode1)
-                arg2    = self.resolve_inarg(in2,opmode2)
-
-                if cond(arg1):
-                    self.pc = arg2
-                else:
-                    self.pc += 3
-            elif opcode == 9:
-                in1 = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                arg1 = self.resolve_inarg(in1,opmode1)
-
-                self.relative_base += arg1
-
-                self.pc += 2
-
-            else:
-                raise Exception('invalid opcode {} at {}'.format(opcode, self.pc))
 
 class Canvas:
     def __init__(self,h,w):
@@ -196,9 +35,13 @@ class Canvas:
         self.the_canvas = []
         for y in range(h):
             self.the_canvas.append([' ']*w)
+        # cells changed since last drawn
+        self.dirty = set()
 
     def set(self,pos,tile):
-        self.the_canvas[pos[1]][pos[0]] = tile
+        if self.the_canvas[pos[1]][pos[0]] != tile:
+            self.the_canvas[pos[1]][pos[0]] = tile
+            self.dirty.add((pos[0],pos[1]))
 
     def get(self,pos):
         return self.the_canvas[pos[1]][pos[0]]
@@ -214,10 +57,10 @@ class Canvas:
 
 
 class ArcadeGame:
-    def __init__(self,prog):
+    def __init__(self,prog,frames_per_draw=1):
         self.computer = IntcodeComputer(prog)
-        self.input_pipe = []
-        self.output_pipe = []
+        self.input_pipe = deque()
+        self.output_pipe = deque()
 
         self.height=25
         self.width=38
@@ -225,6 +68,13 @@ class ArcadeGame:
         self.canvas = Canvas(self.height,self.width)
 
         self.score = 0
+        self.nblocks = 0
+        self.ball_x = 0
+        self.paddle_x = 0
+
+        # run this many frames of the game for each one drawn
+        self.frames_per_draw = frames_per_draw
+        self.drawn_text = None
 
         pygame.init()
         self.screen = pygame.display.set_mode([20*self.width,20*self.height])
@@ -234,31 +84,41 @@ class ArcadeGame:
         self.font = pygame.font.Font(pygame.font.get_default_font(), self.font_size)
 
 
+    def draw_cell(self,x,y):
+        rect = pygame.Rect(20*x,20*y,20,20)
+        self.screen.fill((255,255,255),rect)
+
+        tile = self.canvas.get([x,y])
+        if tile == 'o':
+            pygame.draw.circle(self.screen, (0, 0, 200), (20*x+10, 20*y+10), 10)
+        elif tile == '|':
+            pygame.draw.rect(self.screen, (100, 100, 100), pygame.Rect(20*x+1,20*y+1,18,18))
+        elif tile == '-':
+            pygame.draw.rect(self.screen, (200, 0, 0), pygame.Rect(20*x+1,20*y+1,18,18))
+        elif tile == 'X':
+            pygame.draw.rect(self.screen, (0, 200, 0), pygame.Rect(20*x+1,20*y+1,18,18))
+
+        return rect
+
     def draw(self):
+        # redraw only the cells changed since the last call, and the text if
+        # it changed, drawing the text last as it covers part of the board
 
-        self.screen.fill((255,255,255))
-        # Draw a solid blue circle in the center
-
-        for y in range(self.height):
-            for x in range(self.width):
-                tile = self.canvas.get([x,y])
-                if tile == 'o':
-                    pygame.draw.circle(self.screen, (0, 0, 200), (20*x+10, 20*y+10), 10)
-                elif tile == '|':
-                    pygame.draw.rect(self.screen, (100, 100, 100), pygame.Rect(20*x+1,20*y+1,18,18))
-                elif tile == '-':
-                    pygame.draw.rect(self.screen, (200, 0, 0), pygame.Rect(20*x+1,20*y+1,18,18))
-                elif tile == 'X':
-                    pygame.draw.rect(self.screen, (0, 200, 0), pygame.Rect(20*x+1,20*y+1,18,18))
-
-        # now print the text
-        text = 'Score: {}      Blocks: {}'.format(self.score,self.canvas.count_tile('X'))
-        text_surface = self.font.render(text, True, (0, 0, 0))
-        self.screen.blit(text_surface, dest=(10,self.height*20-self.font_size-10))
-        # Flip the display
-        pygame.display.flip()
+        rects = [self.draw_cell(x,y) for x,y in self.canvas.dirty]
+        self.canvas.dirty.clear()
 
+        text = 'Score: {}      Blocks: {}'.format(self.score,self.nblocks)
+        text_rect = pygame.Rect(0,self.height*20-self.font_size-20,20*self.width,self.font_size+20)
+        if text != self.drawn_text or any(rect.colliderect(text_rect) for rect in rects):
+            for y in range(text_rect.top//20,self.height):
+                for x in range(self.width):
+                    self.draw_cell(x,y)
+            text_surface = self.font.render(text, True, (0, 0, 0))
+            self.screen.blit(text_surface, dest=(10,self.height*20-self.font_size-10))
+            rects.append(text_rect)
+            self.drawn_text = text
 
+        pygame.display.update(rects)
 
     def run(self):
 
@@ -267,6 +127,9 @@ class ArcadeGame:
         initial_speed = 2.0
         speed = initial_speed
 
+        self.screen.fill((255,255,255))
+        pygame.display.flip()
+
         while running:
 
             # execute program until input is needed or halted
@@ -275,26 +138,29 @@ class ArcadeGame:
             # read output
             tiles = ' |X-o'
 
-            while len(self.output_pipe) > 0:
-                x        = self.output_pipe.pop(0)
-                y        = self.output_pipe.pop(0)
-                data   = self.output_pipe.pop(0)
+            for x,y,data in drain_records(self.output_pipe,3):
                 if x==-1 and y==0:
                     self.score = data
 
                 else:
                     tile_idx = data
                     tile = tiles[tile_idx]
+                    self.nblocks += (tile == 'X') - (self.canvas.get([x,y]) == 'X')
                     self.canvas.set([x,y],tile)
+                    if tile == 'o':
+                        self.ball_x = x
+                    elif tile == '-':
+                        self.paddle_x = x
 
-            # print out state
-            # print(" ---- Iteration {:10d} Score: {:10d} ----".format(i,self.score))
-            self.draw()
             i += 1
             if self.computer.halted:
                 running = False
 
-            self.clock.tick(speed)
+            if i % self.frames_per_draw == 0 or not running:
+                # print out state
+                # print(" ---- Iteration {:10d} Score: {:10d} ----".format(i,self.score))
+                self.draw()
+                self.clock.tick(speed)
 
             # handle input
             for event in pygame.event.get():
@@ -309,6 +175,9 @@ class ArcadeGame:
                         speed /= 1.5
                     elif event.key == K_HOME:
                         speed = initial_speed
+                    elif event.key == K_END:
+                        # as fast as possible
+                        speed = 0
 
             # pressed = pygame.key.get_pressed()
 
@@ -318,15 +187,7 @@ class ArcadeGame:
             # if pressed[K_LEFT]:
             #     inp -= 1
 
-            ballpos = None
-            panelpos = None
-            for y,row in enumerate(self.canvas.the_canvas):
-                for x,t in enumerate(row):
-                    if t=='o':
-                        ballpos = [x,y]
-                    if t=='-':
-                        panelpos = [x,y]
-            diff = ballpos[0]-panelpos[0]
+            diff = self.ball_x-self.paddle_x
             inp = 0 if diff == 0 else 1 if diff > 0 else -1
 
             self.input_pipe.append(inp)
@@ -338,16 +199,22 @@ class ArcadeGame:
         print("Number of blocks:",self.canvas.count_tile('X'))
 
 
+# day13-pygame.py <input> [--frames-per-draw <n>]
+frames_per_draw = 1
+if '--frames-per-draw' in sys.argv:
+    k = sys.argv.index('--frames-per-draw')
+    frames_per_draw = int(sys.argv[k+1])
+    del sys.argv[k:k+2]
+
 if len(sys.argv) != 2:
     print("Insufficient arguments!")
     sys.exit(1)
 
-prog = open(sys.argv[1]).read()
-
-state = list(map(int,prog.split(',')))
+state = load_program(sys.argv[1])
 
-state[0] = 2
+game = ArcadeGame(state,frames_per_draw)
 
-game = ArcadeGame(state)
+# play for free
+game.computer.write(0,2)
 
 game.run()
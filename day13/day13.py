@@ -4,176 +4,14 @@
 # @author Karl Ljungkvist <k.ljungkvist@gmail.com>
 
 
+import os
 import sys
 import time
+from collections import deque
 
-class Memory:
-    def __init__(self,state):
-        self.state = list(state)
-
-    def read(self,addr):
-        if addr < len(self.state):
-            return self.state[addr]
-        else:
-            return 0
-
-    def write(self,addr,data):
-        if addr >= len(self.state):
-            current_len = len(self.state)
-            missing = addr-(current_len-1)
-            self.state += [0]*missing
-        self.state[addr] = data
-
-    def __str__(self):
-        s = ""
-        nreps = 1
-        prev = None
-        for d in self.state:
-            if d == prev:
-                nreps += 1
-            elif nreps > 1:
-
-                s += " ... *{} ".format(nreps)
-                # also print the next entry
-                s += ", {}".format(d)
-                nreps = 1
-            else:
-                s += ", {}".format(d)
-
-            prev = d
-
-        return "["+s[1:].strip()+"]"
-
-
-class IntcodeComputer:
-    def __init__(self,state):
-        self.mem = Memory(state)
-        self.pc = 0
-        self.relative_base = 0
-        self.halted = False
-
-    def resolve_inarg(self,arg,opmode):
-        if opmode == 1:
-            return arg
-        elif opmode == 0:
-            return self.mem.read(arg)
-        elif opmode == 2:
-            return self.mem.read(self.relative_base + arg)
-        else:
-            return None
-
-    def resolve_outarg_addr(self,arg,opmode):
-        if opmode == 0:
-            return arg
-        elif opmode == 2:
-            return self.relative_base + arg
-        else:
-            return None
-
-    def execute(self, input_queue, output_queue):
-
-        if self.halted:
-            raise Exception("Cannot execute computer, already halted")
-
-        while True:
-
-            opcode = self.mem.read(self.pc) % 100
-            opmode = self.mem.read(self.pc) // 100
-
-            # print("pc: {}, opcode: {}, opmode: {}, relbase: {}, state: {}, output: {}".format(self.pc, opcode, opmode, self.relative_base, self.mem, output_queue))
-
-            if opcode == 99:
-                # halt
-                self.halted = True
-                break
-
-            if opcode in [1,2,7,8]:
-
-                if opcode == 1:
-                    # add
-                    operation = lambda a,b: a+b
-                elif opcode == 2:
-                    # multiply
-                    operation = lambda a,b: a*b
-                elif opcode == 7:
-                    # less-than
-                    operation = lambda a,b: 1 if a<b else 0
-                elif opcode == 8:
-                    # equals
-                    operation = lambda a,b: 1 if a==b else 0
-
-                in1 = self.mem.read(self.pc+1)
-                in2 = self.mem.read(self.pc+2)
-                out = self.mem.read(self.pc+3)
-
-                opmode1 = opmode % 10
-                opmode2 = (opmode//10) % 10
-                opmode3 = (opmode//100) % 10
-
-                arg1    = self.resolve_inarg(in1,opmode1)
-                arg2    = self.resolve_inarg(in2,opmode2)
-                outaddr = self.resolve_outarg_addr(out,opmode3)
-
-                self.mem.write(outaddr,operation(arg1,arg2))
-
-                self.pc += 4
-            elif opcode == 3:
-                # read input
-
-                out = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                outaddr = self.resolve_outarg_addr(out,opmode1)
-
-                if len(input_queue) == 0:
-                    # waiting for input...
-                    break
-
-                # have enough input
-                self.mem.write(outaddr,input_queue.pop(0))
-
-                self.pc += 2
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from intcode import IntcodeComputer, HALTED, drain_records, load_program
 
-            elif opcode == 4:
-                # write output
-                in1 = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                arg1 = self.resolve_inarg(in1,opmode1)
-
-                output_queue.append(arg1)
-                self.pc += 2
-
-            elif opcode in [5,6]:
-                if opcode == 5:
-                    # jump-if-true
-                    cond = lambda a: a != 0
-                elif opcode == 6:
-                    # jump-if-false
-                    cond = lambda a: a == 0
-
-                in1 = self.mem.read(self.pc+1)
-                in2 = self.mem.read(self.pc+2)
-
-                opmode1 = opmode % 10
-                opmode2 = (opmode//10) % 10
-
-                arg1    = self.resolve_inarg(in1,opmode1)
-                arg2    = self.resolve_inarg(in2,opmode2)
-
-                if cond(arg1):
-                    self.pc = arg2
-                else:
-                    self.pc += 3
-            elif opcode == 9:
-                in1 = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                arg1 = self.resolve_inarg(in1,opmode1)
-
-                self.relative_base += arg1
-
-                self.pc += 2
-
-            else:
-                raise Exception('invalid opcode {} at {}'.format(opcode, self.pc))
 
 class Canvas:
     def __init__(self,h,w):
@@ -202,8 +40,8 @@ class Canvas:
 class ArcadeGame:
     def __init__(self,prog,h,w):
         self.computer = IntcodeComputer(prog)
-        self.input_pipe = []
-        self.output_pipe = []
+        self.input_pipe = deque()
+        self.output_pipe = deque()
         self.height=h
         self.width=w
 
@@ -222,10 +60,7 @@ class ArcadeGame:
             # read output
             tiles = ' |X-o'
 
-            while len(self.output_pipe) > 0:
-                x        = self.output_pipe.pop(0)
-                y        = self.output_pipe.pop(0)
-                data   = self.output_pipe.pop(0)
+            for x,y,data in drain_records(self.output_pipe,3):
                 if x==-1 and y==0:
                     score = data
 
@@ -253,14 +88,51 @@ class ArcadeGame:
 
         print("Number of blocks:",self.canvas.count_tile('X'))
 
+    def autoplay(self):
+        # play a full game without rendering, moving the paddle towards the
+        # ball every frame
+
+        # insert quarters
+        self.computer.write(0,2)
+
+        tiles = ' |X-o'
+        score = 0
+        ball_x = paddle_x = 0
+        nframes = 0
+        t0 = time.time()
+        while True:
+            status = self.computer.execute(self.input_pipe,self.output_pipe)
+            nframes += 1
 
-if len(sys.argv) != 2:
+            for x,y,data in drain_records(self.output_pipe,3):
+                if x==-1 and y==0:
+                    score = data
+                else:
+                    self.canvas.set([x,y],tiles[data])
+                    if data == 3:
+                        paddle_x = x
+                    elif data == 4:
+                        ball_x = x
+
+            if status == HALTED:
+                break
+
+            self.input_pipe.append((ball_x > paddle_x) - (ball_x < paddle_x))
+        t = time.time()-t0
+
+        print("Final score:",score)
+        print("Blocks left:",self.canvas.count_tile('X'))
+        print("Frames: {} ({:.0f} frames/s)".format(nframes,nframes/t))
+
+
+# day13.py <input> [--headless]
+headless = '--headless' in sys.argv[2:]
+
+if len(sys.argv) != 2+headless:
     print("Insufficient arguments!")
     sys.exit(1)
 
-prog = open(sys.argv[1]).read()
-
-state = list(map(int,prog.split(',')))
+state = load_program(sys.argv[1])
 
 # state[0] = 2
 
@@ -268,4 +140,7 @@ h = 25
 w = 40
 game = ArcadeGame(state,h,w)
 
-game.run()
+if headless:
+    game.autoplay()
+else:
+    game.run()
@@ -3,190 +3,33 @@
 # @(#)day15.py
 # @author Karl Ljungkvist <k.ljungkvist@gmail.com>
 
+import os
 import sys
 import time
-import pygame
-
-from pygame.locals import (
-    K_UP,
-    K_DOWN,
-    K_LEFT,
-    K_RIGHT,
-    K_HOME,
-    K_PAGEUP,
-    K_PAGEDOWN,
-    K_ESCAPE,
-    KEYDOWN,
-    QUIT,
-)
-
-class Memory:
-    def __init__(self,state):
-        self.state = list(state)
-
-    def read(self,addr):
-        if addr < len(self.state):
-            return self.state[addr]
-        else:
-            return 0
-
-    def write(self,addr,data):
-        if addr >= len(self.state):
-            current_len = len(self.state)
-            missing = addr-(current_len-1)
-            self.state += [0]*missing
-        self.state[addr] = data
-
-    def __str__(self):
-        s = ""
-        nreps = 1
-        prev = None
-        for d in self.state:
-            if d == prev:
-                nreps += 1
-            elif nreps > 1:
-
-                s += " ... *{} ".format(nreps)
-                # also print the next entry
-                s += ", {}".format(d)
-                nreps = 1
-            else:
-                s += ", {}".format(d)
-
-            prev = d
-
-        return "["+s[1:].strip()+"]"
-
-
-class IntcodeComputer:
-    def __init__(self,state):
-        self.mem = Memory(state)
-        self.pc = 0
-        self.relative_base = 0
-        self.halted = False
-
-    def resolve_inarg(self,arg,opmode):
-        if opmode == 1:
-            return arg
-        elif opmode == 0:
-            return self.mem.read(arg)
-        elif opmode == 2:
-            return self.mem.read(self.relative_base + arg)
-        else:
-            return None
-
-    def resolve_outarg_addr(self,arg,opmode):
-        if opmode == 0:
-            return arg
-        elif opmode == 2:
-            return self.relative_base + arg
-        else:
-            return None
-
-    def execute(self, input_queue, output_queue):
-
-        if self.halted:
-            raise Exception("Cannot execute computer, already halted")
-
-        while True:
-
-            opcode = self.mem.read(self.pc) % 100
-            opmode = self.mem.read(self.pc) // 100
-
-            # print("pc: {}, opcode: {}, opmode: {}, relbase: {}, state: {}, output: {}".format(self.pc, opcode, opmode, self.relative_base, self.mem, output_queue))
-
-            if opcode == 99:
-                # halt
-                self.halted = True
-                break
-
-            if opcode in [1,2,7,8]:
-
-                if opcode == 1:
-                    # add
-                    operation = lambda a,b: a+b
-                elif opcode == 2:
-                    # multiply
-                    operation = lambda a,b: a*b
-                elif opcode == 7:
-                    # less-than
-                    operation = lambda a,b: 1 if a<b else 0
-                elif opcode == 8:
-                    # equals
-                    operation = lambda a,b: 1 if a==b else 0
-
-                in1 = self.mem.read(self.pc+1)
-                in2 = self.mem.read(self.pc+2)
-                out = self.mem.read(self.pc+3)
-
-                opmode1 = opmode % 10
-                opmode2 = (opmode//10) % 10
-                opmode3 = (opmode//100) % 10
-
-                arg1    = self.resolve_inarg(in1,opmode1)
-                arg2    = self.resolve_inarg(in2,opmode2)
-                outaddr = self.resolve_outarg_addr(out,opmode3)
-
-                self.mem.write(outaddr,operation(arg1,arg2))
-
-                self.pc += 4
-            elif opcode == 3:
-                # read input
-
-                out = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                outaddr = self.resolve_outarg_addr(out,opmode1)
-
-                if len(input_queue) == 0:
-                    # waiting for input...
-                    break
-
-                # have enough input
-                self.mem.write(outaddr,input_queue.pop(0))
-
-                self.pc += 2
-
-            elif opcode == 4:
-                # write output
-                in1 = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                arg1 = self.resolve_inarg(in1,opmode1)
+from collections import deque
 
-                output_queue.append(arg1)
-                self.pc += 2
+# day15.py <input> [--headless]
+headless = '--headless' in sys.argv[2:]
 
-            elif opcode in [5,6]:
-                if opcode == 5:
-                    # jump-if-true
-                    cond = lambda a: a != 0
-                elif opcode == 6:
-                    # jump-if-false
-                    cond = lambda a: a == 0
+if not headless:
+    import pygame
 
-                in1 = self.mem.read(self.pc+1)
-                in2 = self.mem.read(self.pc+2)
+    from pygame.locals import (
+        K_UP,
+        K_DOWN,
+        K_LEFT,
+        K_RIGHT,
+        K_HOME,
+        K_PAGEUP,
+        K_PAGEDOWN,
+        K_ESCAPE,
+        KEYDOWN,
+        QUIT,
+    )
 
-                opmode1 = opmode % 10
-                opmode2 = (opmode//10) % 10
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from intcode import IntcodeComputer, load_program
 
-                arg1    = self.resolve_inarg(in1,opmode1)
-                arg2    = self.resolve_inarg(in2,opmode2)
-
-                if cond(arg1):
-                    self.pc = arg2
-                else:
-                    self.pc += 3
-            elif opcode == 9:
-                in1 = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                arg1 = self.resolve_inarg(in1,opmode1)
-
-                self.relative_base += arg1
-
-                self.pc += 2
-
-            else:
-                raise Exception('invalid opcode {} at {}'.format(opcode, self.pc))
 
 class Canvas:
     def __init__(self,h,w):
@@ -195,9 +38,13 @@ class Canvas:
         self.the_canvas = []
         for y in range(h):
             self.the_canvas.append([' ']*w)
+        # cells changed since last drawn
+        self.dirty = set()
 
     def set(self,pos,tile):
-        self.the_canvas[pos[1]][pos[0]] = tile
+        if self.the_canvas[pos[1]][pos[0]] != tile:
+            self.the_canvas[pos[1]][pos[0]] = tile
+            self.dirty.add((pos[0],pos[1]))
 
     def get(self,pos):
         return self.the_canvas[pos[1]][pos[0]]
@@ -221,11 +68,87 @@ def get_new_pos(old_pos,direction):
     elif direction == 4:
         return [old_pos[0]+1,old_pos[1]]
 
+def explore(computer):
+    # map the maze breadth-first, without moving any droid back. Every open
+    # cell on the frontier has its own fork of the droid program, standing
+    # on that cell. Returns the tiles of all cells seen, with positions
+    # relative to the start, the distance from the start to each open cell,
+    # and the position of the leak.
+    start = (0,0)
+    tiles = {start: '.'}
+    distances = {start: 0}
+    leak_pos = None
+
+    frontier = deque([(start,computer)])
+    while frontier:
+        pos,droid = frontier.popleft()
+        for direction in [1,2,3,4]:
+            new_pos = tuple(get_new_pos(pos,direction))
+            if new_pos in tiles:
+                continue
+
+            moved = droid.fork()
+            output_pipe = deque()
+            moved.step_until_output(deque([direction]),output_pipe)
+            out = output_pipe.popleft()
+
+            if out == 0:
+                tiles[new_pos] = '#'
+                continue
+
+            tiles[new_pos] = '.' if out == 1 else '*'
+            distances[new_pos] = distances[pos]+1
+            if out == 2:
+                leak_pos = new_pos
+            frontier.append((new_pos,moved))
+
+    return tiles,distances,leak_pos
+
+def make_canvas(tiles):
+    # canvas just large enough for the tiles, and the offset of the start
+    xmin = min(x for x,y in tiles)
+    ymin = min(y for x,y in tiles)
+    xmax = max(x for x,y in tiles)
+    ymax = max(y for x,y in tiles)
+    canvas = Canvas(ymax-ymin+1,xmax-xmin+1)
+    for (x,y),tile in tiles.items():
+        canvas.set([x-xmin,y-ymin],tile)
+    return canvas,(-xmin,-ymin)
+
+def fill_oxygen(canvas,sources,on_minute=None):
+    # spread oxygen from the sources over all reachable open cells, marking
+    # them '*', keeping only the cells reached in the last minute. Returns the
+    # minutes it took, and the minute at which each cell was reached. The
+    # cells reached are passed on to on_minute after each minute.
+    rows = canvas.the_canvas
+    w = canvas.width
+    h = canvas.height
+
+    arrival = {tuple(pos): 0 for pos in sources}
+    wavefront = list(arrival)
+    minutes = 0
+    while True:
+        next_wavefront = []
+        for x,y in wavefront:
+            for px,py in [(x-1,y),(x+1,y),(x,y-1),(x,y+1)]:
+                if 0 <= px < w and 0 <= py < h and rows[py][px] == '.':
+                    rows[py][px] = '*'
+                    arrival[px,py] = minutes+1
+                    next_wavefront.append((px,py))
+
+        if not next_wavefront:
+            return minutes,arrival
+
+        wavefront = next_wavefront
+        minutes += 1
+        if on_minute:
+            on_minute(minutes,wavefront)
+
 class RepairDroidGame:
-    def __init__(self,prog):
+    def __init__(self,prog,frames_per_draw=1):
         self.computer = IntcodeComputer(prog)
-        self.input_pipe = []
-        self.output_pipe = []
+        self.input_pipe = deque()
+        self.output_pipe = deque()
 
         self.height=50
         self.width=50
@@ -235,34 +158,61 @@ class RepairDroidGame:
         self.canvas = Canvas(self.height,self.width)
         self.canvas.set(self.droid_pos,'.')
 
+        # run this many steps for each one drawn
+        self.frames_per_draw = frames_per_draw
+        # where the droid was last drawn, if shown
+        self.drawn_droid_pos = None
+
         pygame.init()
         self.screen = pygame.display.set_mode([20*self.width,20*self.height])
         self.clock = pygame.time.Clock()
 
-    def draw(self, show_bot=True):
+    def draw_cell(self,x,y,show_bot):
+        rect = pygame.Rect(20*x,20*y,20,20)
+        self.screen.fill((255,255,255),rect)
+
+        if show_bot and [x,y] == self.droid_pos:
+            pygame.draw.circle(self.screen, (150, 0, 0), (20*x+10, 20*y+10), 10)
+        else:
+
+            tile = self.canvas.get([x,y])
+            if tile == '#':
+                pygame.draw.rect(self.screen, (0, 0, 200), pygame.Rect(20*x+1,20*y+1,18,18))
+            elif tile == ' ':
+                pygame.draw.rect(self.screen, (0, 150, 0), pygame.Rect(20*x+1,20*y+1,18,18))
+            elif tile == '*':
+                pygame.draw.circle(self.screen, (255, 0, 255), (20*x+10, 20*y+10), 5)
+            elif tile == '.':
+                pass # we can pass through here, then just leave it blank!
 
-        self.screen.fill((255,255,255))
-        # Draw a solid blue circle in the center
+        return rect
 
+    def draw_all(self):
         for y in range(self.height):
             for x in range(self.width):
-                if show_bot and [x,y] == self.droid_pos:
-                    pygame.draw.circle(self.screen, (150, 0, 0), (20*x+10, 20*y+10), 10)
-                else:
-
-                    tile = self.canvas.get([x,y])
-                    if tile == '#':
-                        pygame.draw.rect(self.screen, (0, 0, 200), pygame.Rect(20*x+1,20*y+1,18,18))
-                    elif tile == ' ':
-                        pygame.draw.rect(self.screen, (0, 150, 0), pygame.Rect(20*x+1,20*y+1,18,18))
-                    elif tile == '*':
-                        pygame.draw.circle(self.screen, (255, 0, 255), (20*x+10, 20*y+10), 5)
-                    elif tile == '.':
-                        pass # we can pass through here, then just leave it blank!
-
-        # Flip the display
+                self.draw_cell(x,y,True)
+        self.canvas.dirty.clear()
+        self.drawn_droid_pos = tuple(self.droid_pos)
         pygame.display.flip()
 
+    def draw(self, show_bot=True):
+        # redraw only the cells changed since the last call, and where the
+        # droid was and is
+
+        dirty = self.canvas.dirty
+        if self.drawn_droid_pos is not None:
+            dirty.add(self.drawn_droid_pos)
+        if show_bot:
+            dirty.add(tuple(self.droid_pos))
+            self.drawn_droid_pos = tuple(self.droid_pos)
+        else:
+            self.drawn_droid_pos = None
+
+        rects = [self.draw_cell(x,y,show_bot) for x,y in dirty]
+        dirty.clear()
+
+        pygame.display.update(rects)
+
     def run(self):
 
         i=0
@@ -273,9 +223,13 @@ class RepairDroidGame:
         if explore:
             print("Exploring...")
 
+        self.draw_all()
+
         while True:
 
-            self.draw()
+            i += 1
+            if i % self.frames_per_draw == 0 or not explore:
+                self.draw()
 
             if explore:
 
@@ -323,11 +277,11 @@ class RepairDroidGame:
             if inp:
                 self.input_pipe.append(inp)
 
-                # execute program until input is needed or halted
-                self.computer.execute(self.input_pipe,self.output_pipe)
+                # execute program until the status of the move is reported
+                self.computer.step_until_output(self.input_pipe,self.output_pipe)
 
                 # read output
-                out = self.output_pipe.pop(0)
+                out = self.output_pipe.popleft()
 
                 requested_pos = get_new_pos(self.droid_pos,inp)
 
@@ -351,6 +305,7 @@ class RepairDroidGame:
                     elif out == 2:
                         self.canvas.set(requested_pos,'*')
                         leak_distance = len(trajectory)-1
+                        leak_pos = requested_pos
 
 
             if self.computer.halted:
@@ -358,48 +313,56 @@ class RepairDroidGame:
 
             fps = 30
             if explore:
-                fps = 120
+                fps = 120 if self.frames_per_draw == 1 else 0
+                if i % self.frames_per_draw != 0:
+                    continue
             self.clock.tick(fps)
 
         print("Distance from start to leak:",leak_distance)
 
         fill = True
-        minutes=0
         if fill:
-            while self.canvas.count_tile('.') > 0:
-                self.draw(False)
-                current_oxygen_pts = []
-                for y in range(self.canvas.height):
-                    for x in range(self.canvas.width):
-                        if self.canvas.get([x,y]) == '*':
-                            current_oxygen_pts.append([x,y])
-                for op in current_oxygen_pts:
-                    # spread oxygen
-                    surrounding_pts = [[op[0]-1,op[1]],
-                                       [op[0]+1,op[1]],
-                                       [op[0],op[1]-1],
-                                       [op[0],op[1]+1]]
-
-                    for p in surrounding_pts:
-                        pt = self.canvas.get(p)
-                        if pt == '.':
-                            self.canvas.set(p,'*')
-
-                minutes += 1
-                self.clock.tick(30)
+            def on_minute(minute,wavefront):
+                self.canvas.dirty.update(wavefront)
+                if minute % self.frames_per_draw == 0:
+                    self.draw(False)
+                    self.clock.tick(30)
+
+            self.draw(False)
+            minutes,arrival = fill_oxygen(self.canvas,[leak_pos],on_minute)
+            self.draw(False)
 
             print("Filling all locations with oxygen took {} minuets.".format(minutes))
 
         pygame.quit()
 
-if len(sys.argv) != 2:
+# day15.py <input> [--frames-per-draw <n>]
+frames_per_draw = 1
+if '--frames-per-draw' in sys.argv:
+    k = sys.argv.index('--frames-per-draw')
+    frames_per_draw = int(sys.argv[k+1])
+    del sys.argv[k:k+2]
+
+if len(sys.argv) != 2+headless:
     print("Insufficient arguments!")
     sys.exit(1)
 
-prog = open(sys.argv[1]).read()
+state = load_program(sys.argv[1])
+
+if headless:
+    t0 = time.time()
+    tiles,distances,leak_pos = explore(IntcodeComputer(state))
+    t = time.time()-t0
 
-state = list(map(int,prog.split(',')))
+    canvas,start = make_canvas(tiles)
+    canvas.display()
+    print("Mapped {} cells in {:.3f} s".format(len(tiles),t))
+    print("Distance from start to leak:",distances[leak_pos])
 
-game = RepairDroidGame(state)
+    leak = [leak_pos[0]+start[0],leak_pos[1]+start[1]]
+    minutes,arrival = fill_oxygen(canvas,[leak])
+    print("Filling all locations with oxygen took {} minuets.".format(minutes))
+else:
+    game = RepairDroidGame(state,frames_per_draw)
 
-game.run()
+    game.run()
@@ -3,214 +3,60 @@
 # @(#)day17.py
 # @author Karl Ljungkvist <k.ljungkvist@gmail.com>
 
+import os
 import sys
 import time
+from collections import deque
 
-class Memory:
-    def __init__(self,state):
-        self.state = list(state)
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from intcode import IntcodeComputer, AsciiDecoder, load_program
 
-    def read(self,addr):
-        if addr < len(self.state):
-            return self.state[addr]
-        else:
-            return 0
-
-    def write(self,addr,data):
-        if addr >= len(self.state):
-            current_len = len(self.state)
-            missing = addr-(current_len-1)
-            self.state += [0]*missing
-        self.state[addr] = data
-
-    def __str__(self):
-        s = ""
-        nreps = 1
-        prev = None
-        for d in self.state:
-            if d == prev:
-                nreps += 1
-            elif nreps > 1:
-
-                s += " ... *{} ".format(nreps)
-                # also print the next entry
-                s += ", {}".format(d)
-                nreps = 1
-            else:
-                s += ", {}".format(d)
-
-            prev = d
-
-        return "["+s[1:].strip()+"]"
-
-
-class IntcodeComputer:
-    def __init__(self,state):
-        self.mem = Memory(state)
-        self.pc = 0
-        self.relative_base = 0
-        self.halted = False
-
-    def resolve_inarg(self,arg,opmode):
-        if opmode == 1:
-            return arg
-        elif opmode == 0:
-            return self.mem.read(arg)
-        elif opmode == 2:
-            return self.mem.read(self.relative_base + arg)
-        else:
-            return None
-
-    def resolve_outarg_addr(self,arg,opmode):
-        if opmode == 0:
-            return arg
-        elif opmode == 2:
-            return self.relative_base + arg
-        else:
-            return None
-
-    def execute(self, input_queue, output_queue):
-
-        if self.halted:
-            raise Exception("Cannot execute computer, already halted")
-
-        while True:
-
-            opcode = self.mem.read(self.pc) % 100
-            opmode = self.mem.read(self.pc) // 100
-
-            # print("pc: {}, opcode: {}, opmode: {}, relbase: {}, state: {}, output: {}".format(self.pc, opcode, opmode, self.relative_base, self.mem, output_queue))
-
-            if opcode == 99:
-                # halt
-                self.halted = True
-                break
-
-            if opcode in [1,2,7,8]:
-
-                if opcode == 1:
-                    # add
-                    operation = lambda a,b: a+b
-                elif opcode == 2:
-                    # multiply
-                    operation = lambda a,b: a*b
-                elif opcode == 7:
-                    # less-than
-                    operation = lambda a,b: 1 if a<b else 0
-                elif opcode == 8:
-                    # equals
-                    operation = lambda a,b: 1 if a==b else 0
-
-                in1 = self.mem.read(self.pc+1)
-                in2 = self.mem.read(self.pc+2)
-                out = self.mem.read(self.pc+3)
-
-                opmode1 = opmode % 10
-                opmode2 = (opmode//10) % 10
-                opmode3 = (opmode//100) % 10
-
-                arg1    = self.resolve_inarg(in1,opmode1)
-                arg2    = self.resolve_inarg(in2,opmode2)
-                outaddr = self.resolve_outarg_addr(out,opmode3)
-
-                self.mem.write(outaddr,operation(arg1,arg2))
-
-                self.pc += 4
-            elif opcode == 3:
-                # read input
-
-                out = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                outaddr = self.resolve_outarg_addr(out,opmode1)
-
-                if len(input_queue) == 0:
-                    # waiting for input...
-                    break
-
-                # have enough input
-                self.mem.write(outaddr,input_queue.pop(0))
-
-                self.pc += 2
-
-            elif opcode == 4:
-                # write output
-                in1 = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                arg1 = self.resolve_inarg(in1,opmode1)
-
-                output_queue.append(arg1)
-                self.pc += 2
-
-            elif opcode in [5,6]:
-                if opcode == 5:
-                    # jump-if-true
-                    cond = lambda a: a != 0
-                elif opcode == 6:
-                    # jump-if-false
-                    cond = lambda a: a == 0
-
-                in1 = self.mem.read(self.pc+1)
-                in2 = self.mem.read(self.pc+2)
-
-                opmode1 = opmode % 10
-                opmode2 = (opmode//10) % 10
-
-                arg1    = self.resolve_inarg(in1,opmode1)
-                arg2    = self.resolve_inarg(in2,opmode2)
 
-                if cond(arg1):
-                    self.pc = arg2
-                else:
-                    self.pc += 3
-            elif opcode == 9:
-                in1 = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                arg1 = self.resolve_inarg(in1,opmode1)
+SCAFFOLD = ord('#')
+INTERSECTION = ord('O')
 
-                self.relative_base += arg1
+# bytes with scaffold mapped to 1 and everything else to 0
+SCAFFOLD_BITS = bytes(1 if c == SCAFFOLD else 0 for c in range(256))
 
-                self.pc += 2
-
-            else:
-                raise Exception('invalid opcode {} at {}'.format(opcode, self.pc))
 class Canvas:
-    def __init__(self,bytelst):
-        self.canvas = [line for line in bytes(bytelst).decode().splitlines() if len(line) > 0]
+    def __init__(self,decoder):
+        # copies of the decoded rows, so that they can be marked
+        self.canvas = [bytearray(line) for line in decoder.lines() if len(line) > 0]
         self.height = len(self.canvas)
         self.width = len(self.canvas[0])
 
     def print(self):
         for line in self.canvas:
-            print(line)
+            print(line.decode())
 
     def get_intersections(self):
+        # each row as an integer with one byte per cell, 1 on scaffold, so
+        # that a shift by 8 bits moves to the neighbouring column
+        masks = [int.from_bytes(line.translate(SCAFFOLD_BITS),'little') for line in self.canvas]
 
         intersections = []
-        for i in range(self.height):
-            for j in range(self.width):
-
-                if i > 0 and i < (self.height-1) and j>0 and j<(self.width-1) and \
-                self.canvas[i][j] == '#' and \
-                self.canvas[i+1][j] == '#' and self.canvas[i-1][j] == '#' and \
-                self.canvas[i][j+1] == '#' and self.canvas[i][j-1] == '#':
-
-                    intersections.append([i,j])
-                    # print("Intersection at [{}, {}]".format(i,j))
-                    # canvas[i][j] = 'O'
-                    # print("Len before modification:",len(canvas[i]))
-                    self.canvas[i] = self.canvas[i][:j] + 'O' + self.canvas[i][(j+1):]
-                    # print("Len after modification:",len(canvas[i]))
+        for i in range(1,self.height-1):
+            mask = masks[i]
+            crossing = mask & (mask << 8) & (mask >> 8) & masks[i-1] & masks[i+1]
+            if not crossing:
+                continue
+            cells = crossing.to_bytes(len(self.canvas[i]),'little')
+            j = cells.find(1)
+            while j >= 0:
+                intersections.append([i,j])
+                self.canvas[i][j] = INTERSECTION
+                j = cells.find(1,j+1)
 
         return intersections
 
 def get_movement_logic(canvas):
 
     initpos = None
-    for i in range(canvas.height):
-        for j in range(canvas.width):
-            if canvas.canvas[i][j] == '^':
-                initpos= [j,i]
-                break
+    for i,line in enumerate(canvas.canvas):
+        j = line.find(b'^')
+        if j >= 0:
+            initpos = [j,i]
+            break
 
     print("Initial position is",initpos)
 
@@ -228,7 +74,7 @@ def get_movement_logic(canvas):
                 a*x[1]+y[1]]
 
     def is_valid_scaffold(pt):
-        return (pt[0] >= 0 and pt[0] < canvas.width) and (pt[1] >= 0 and pt[1] < canvas.height) and canvas.canvas[pt[1]][pt[0]] == '#'
+        return (pt[0] >= 0 and pt[0] < canvas.width) and (pt[1] >= 0 and pt[1] < canvas.height) and canvas.canvas[pt[1]][pt[0]] == SCAFFOLD
 
     commands = []
     pos = initpos
@@ -264,108 +110,149 @@ def get_movement_logic(canvas):
 
     return commands
 
-def match_sublist(keylist,lst):
-    length = len(keylist)
-    matches = []
-    i=0
-    while i < len(lst):
-        if lst[i:(length+i)]==keylist:
-            matches.append(i)
-            i += length
+class SuffixIndex:
+    # suffix array of a sequence, answering the length of the longest common
+    # prefix of any two suffixes in constant time, through a sparse table of
+    # minima over the LCP array
+    def __init__(self,seq):
+        n = len(seq)
+        self.n = n
+
+        # sort the suffixes by prefix doubling
+        symbols = {sym:k for k,sym in enumerate(sorted(set(seq)))}
+        rank = [symbols[sym] for sym in seq]
+        sa = list(range(n))
+        k = 1
+        while True:
+            key = lambda i: (rank[i], rank[i+k] if i+k < n else -1)
+            sa.sort(key=key)
+            new_rank = [0]*n
+            for a,b in zip(sa,sa[1:]):
+                new_rank[b] = new_rank[a] + (key(a) != key(b))
+            rank = new_rank
+            if n == 0 or rank[sa[-1]] == n-1:
+                break
+            k *= 2
+        self.rank = rank
+
+        # lcp[r] is the common prefix length of suffixes sa[r-1] and sa[r]
+        lcp = [0]*n
+        h = 0
+        for i in range(n):
+            if rank[i] > 0:
+                j = sa[rank[i]-1]
+                while i+h < n and j+h < n and seq[i+h] == seq[j+h]:
+                    h += 1
+                lcp[rank[i]] = h
+                if h > 0:
+                    h -= 1
+            else:
+                h = 0
+
+        # table[l][r] is the minimum of lcp[r:r+2**l]
+        self.table = [lcp]
+        w = 1
+        while 2*w <= n:
+            prev = self.table[-1]
+            self.table.append([min(prev[r],prev[r+w]) for r in range(n-2*w+1)])
+            w *= 2
+
+    def lcp(self,i,j):
+        if i == j:
+            return self.n-i
+        a,b = sorted((self.rank[i],self.rank[j]))
+        a += 1
+        level = (b-a+1).bit_length()-1
+        t = self.table[level]
+        return min(t[a],t[b-(1<<level)+1])
+
+def compress_commands(commands,nroutines=3,max_length=20):
+    # split the commands into a main routine calling at most nroutines
+    # routines, with each routine and the main routine at most max_length
+    # characters. The routines are picked from the front, each new one as
+    # long as possible. Returns [main,A,B,C] for the first split found, or
+    # None if there is none.
+
+    # one symbol per move, a turn and its number of steps
+    moves = [','.join(commands[k:k+2]) for k in range(0,len(commands),2)]
+    n = len(moves)
+    index = SuffixIndex(moves)
+
+    # characters of moves[:k], with a comma after each
+    prefix_chars = [0]
+    for move in moves:
+        prefix_chars.append(prefix_chars[-1]+len(move)+1)
+
+    # longest routine starting at each move
+    longest = []
+    for i in range(n):
+        length = 0
+        while i+length < n and prefix_chars[i+length+1]-prefix_chars[i]-1 <= max_length:
+            length += 1
+        longest.append(length)
+    max_moves = max(longest,default=0)
+    max_calls = (max_length+1)//2
+
+    routines = []
+    main = []
+
+    def search(i):
+        if i == n:
+            return True
+        if (max_calls-len(main))*max_moves < n-i:
+            return False
+
+        for r,(start,length) in enumerate(routines):
+            if index.lcp(start,i) >= length:
+                main.append(r)
+                if search(i+length):
+                    return True
+                main.pop()
+
+        if len(routines) < nroutines:
+            for length in range(longest[i],0,-1):
+                if any(length == l and index.lcp(start,i) >= l for start,l in routines):
+                    continue
+                routines.append((i,length))
+                main.append(len(routines)-1)
+                if search(i+length):
+                    return True
+                main.pop()
+                routines.pop()
+
+        return False
+
+    if not search(0):
+        return None
+
+    names = 'ABCDEFGHIJ'
+    compressed = [[names[r] for r in main]]
+    for r in range(nroutines):
+        if r < len(routines):
+            start,length = routines[r]
+            compressed.append(commands[2*start:2*(start+length)])
         else:
-            i += 1
-    return matches
-
-def find_matching_sublists(commands):
-    matches = []
-
-    for start in range(0,len(commands),2):
-        for length in range(2,len(commands)-start,2):
-
-            keylist = commands[start:start+length]
-
-            if 'A' in keylist or 'B' in keylist or 'C' in keylist:
-                continue
-            if len(','.join(keylist)) > 20:
-                continue
-            if [m for m in matches if m[0]==keylist]:
-                continue
-            m = match_sublist(keylist,commands)
-            if len(m) > 1:
-                reduction = len(m)*len(keylist) - len(m)
-                matches.append([keylist, m, reduction])
-
-    matches.sort(key=lambda m:m[2]*1000+(100-m[1][0]))
-
-    # print("Matches:")
-    # print("{:>8s} {:>8s} {:>8s}   {:<20s} {:<20s}".format("nmatches","length", "reduct.", "matches", "string"))
-    # for m in matches:
-    #     print("{:8d} {:8d} {:8d}   {:<20s} {}".format(len(m[1]), len(m[0]), m[2], '  '.join(str(i) for i in m[1]), m[0]))
-
-    return matches
-
-def replace_sublist_matches(lst, sublist_length, start_indices, new_symbol):
-    # adjust start indices
-    start_indices = [idx-i*(sublist_length-1) for i,idx in enumerate(start_indices)]
-
-    for start in start_indices:
-        lst = lst[0:start]+[new_symbol]+lst[(start+sublist_length):]
-    return lst
-
-def compress_commands(commands_in):
-
-    commands = list(commands_in)
-    compressed = []
-
-    matches_a = find_matching_sublists(commands)
-
-    # find match for A
-    for ma in reversed(matches_a):
-
-        A = ma[0]
-        # print("Replacing A:", ma)
-
-        commands_a = replace_sublist_matches(commands,len(ma[0]),ma[1],'A')
-
-        # find match for B
-        matches_b = find_matching_sublists(commands_a)
-        for mb in reversed(matches_b):
-            B = mb[0]
-            # print("Replacing B:", mb)
-
-            commands_b = replace_sublist_matches(commands_a,len(mb[0]),mb[1],'B')
-
-            # find match for C
-            matches_c = find_matching_sublists(commands_b)
-            for mc in reversed(matches_c):
-                C = mc[0]
-                # print("Replacing C:", mc)
-
-                commands_c = replace_sublist_matches(commands_b,len(mc[0]),mc[1],'C')
-                if all([c in ['A','B','C'] for c in commands_c]):
-                    # we have replaced all. yay.
-                    compressed.append([commands_c,A,B,C])
-
+            compressed.append([])
     return compressed
 
 if len(sys.argv) != 2:
     print("Insufficient arguments!")
     sys.exit(1)
 
-prog = [int(c) for c in open(sys.argv[1]).read().split(',')]
+prog = load_program(sys.argv[1])
 
 ## Part 1
 
 computer = IntcodeComputer(prog)
 
-input_pipe = []
-output_pipe = []
-computer.execute(input_pipe,output_pipe)
+input_pipe = deque()
+camera = AsciiDecoder()
+computer.execute(input_pipe,camera)
 
 if not computer.halted:
     raise Exception("Excpeted a halt")
 
-canvas = Canvas(output_pipe)
+canvas = Canvas(camera)
 
 canvas.print()
 
@@ -382,11 +269,9 @@ print("Alignment parameter:",alignment_parameter)
 
 ## Part 2
 
-prog[0] = 2
-
 print()
 
-canvas = Canvas(output_pipe)
+canvas = Canvas(camera)
 
 commands = get_movement_logic(canvas)
 
@@ -394,39 +279,42 @@ print(",".join(commands))
 
 compressed = compress_commands(commands)
 
-for main,a,b,c in compressed:
-    print("=== Running with movement logic: ===")
-    mainstr = ",".join(main)
-    print("Main: {:20s} \t len: {:5d}".format(mainstr,len(mainstr)))
-    astr = ",".join(a)
-    print("A:    {:20s} \t len: {:5d}".format(astr,len(astr)))
-    bstr = ",".join(b)
-    print("B:    {:20s} \t len: {:5d}".format(bstr,len(bstr)))
-    cstr = ",".join(c)
-    print("C:    {:20s} \t len: {:5d}".format(cstr,len(cstr)))
+if compressed is None:
+    raise Exception("No way to compress the commands")
 
-    computer_pt2 = IntcodeComputer(prog)
+main,a,b,c = compressed
 
-    movement_logic = \
-        mainstr+"\n"+\
-        astr+"\n"+\
-        bstr+"\n"+\
-        cstr+"\n"+\
-        "n\n"
+print("=== Running with movement logic: ===")
+mainstr = ",".join(main)
+print("Main: {:20s} \t len: {:5d}".format(mainstr,len(mainstr)))
+astr = ",".join(a)
+print("A:    {:20s} \t len: {:5d}".format(astr,len(astr)))
+bstr = ",".join(b)
+print("B:    {:20s} \t len: {:5d}".format(bstr,len(bstr)))
+cstr = ",".join(c)
+print("C:    {:20s} \t len: {:5d}".format(cstr,len(cstr)))
 
-    input_pipe = []
-    input_pipe = list(movement_logic.encode())
+computer_pt2 = IntcodeComputer(prog)
+# wake up the robot
+computer_pt2.write(0,2)
 
-    output_pipe = []
-    computer_pt2.execute(input_pipe,output_pipe)
+movement_logic = \
+    mainstr+"\n"+\
+    astr+"\n"+\
+    bstr+"\n"+\
+    cstr+"\n"+\
+    "n\n"
 
-    dust_report = output_pipe.pop(-1)
+input_pipe = deque(movement_logic.encode())
 
-    # print("Output:",bytes(output_pipe))
+video_feed = AsciiDecoder()
+computer_pt2.execute(input_pipe,video_feed)
 
-    print("Amount of dust collected:",dust_report)
-    canvas = Canvas(output_pipe)
+dust_report = video_feed.values[-1]
 
-    canvas.print()
+print("Amount of dust collected:",dust_report)
+canvas = Canvas(video_feed)
+
+canvas.print()
 
-    print("Halted:",computer_pt2.halted)
+print("Halted:",computer_pt2.halted)
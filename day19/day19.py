@@ -3,176 +3,14 @@
 # @(#)day19.py
 # @author Karl Ljungkvist <k.ljungkvist@gmail.com>
 
+import os
 import sys
 import time
 
-class Memory:
-    def __init__(self,state):
-        self.state = list(state)
-
-    def read(self,addr):
-        if addr < len(self.state):
-            return self.state[addr]
-        else:
-            return 0
-
-    def write(self,addr,data):
-        if addr >= len(self.state):
-            current_len = len(self.state)
-            missing = addr-(current_len-1)
-            self.state += [0]*missing
-        self.state[addr] = data
-
-    def __str__(self):
-        s = ""
-        nreps = 1
-        prev = None
-        for d in self.state:
-            if d == prev:
-                nreps += 1
-            elif nreps > 1:
-
-                s += " ... *{} ".format(nreps)
-                # also print the next entry
-                s += ", {}".format(d)
-                nreps = 1
-            else:
-                s += ", {}".format(d)
-
-            prev = d
-
-        return "["+s[1:].strip()+"]"
-
-
-class IntcodeComputer:
-    def __init__(self,state):
-        self.mem = Memory(state)
-        self.pc = 0
-        self.relative_base = 0
-        self.halted = False
-
-    def resolve_inarg(self,arg,opmode):
-        if opmode == 1:
-            return arg
-        elif opmode == 0:
-            return self.mem.read(arg)
-        elif opmode == 2:
-            return self.mem.read(self.relative_base + arg)
-        else:
-            return None
-
-    def resolve_outarg_addr(self,arg,opmode):
-        if opmode == 0:
-            return arg
-        elif opmode == 2:
-            return self.relative_base + arg
-        else:
-            return None
-
-    def execute(self, input_queue, output_queue):
-
-        if self.halted:
-            raise Exception("Cannot execute computer, already halted")
-
-        while True:
-
-            opcode = self.mem.read(self.pc) % 100
-            opmode = self.mem.read(self.pc) // 100
-
-            # print("pc: {}, opcode: {}, opmode: {}, relbase: {}, state: {}, output: {}".format(self.pc, opcode, opmode, self.relative_base, self.mem, output_queue))
-
-            if opcode == 99:
-                # halt
-                self.halted = True
-                break
-
-            if opcode in [1,2,7,8]:
-
-                if opcode == 1:
-                    # add
-                    operation = lambda a,b: a+b
-                elif opcode == 2:
-                    # multiply
-                    operation = lambda a,b: a*b
-                elif opcode == 7:
-                    # less-than
-                    operation = lambda a,b: 1 if a<b else 0
-                elif opcode == 8:
-                    # equals
-                    operation = lambda a,b: 1 if a==b else 0
-
-                in1 = self.mem.read(self.pc+1)
-                in2 = self.mem.read(self.pc+2)
-                out = self.mem.read(self.pc+3)
-
-                opmode1 = opmode % 10
-                opmode2 = (opmode//10) % 10
-                opmode3 = (opmode//100) % 10
-
-                arg1    = self.resolve_inarg(in1,opmode1)
-                arg2    = self.resolve_inarg(in2,opmode2)
-                outaddr = self.resolve_outarg_addr(out,opmode3)
-
-                self.mem.write(outaddr,operation(arg1,arg2))
-
-                self.pc += 4
-            elif opcode == 3:
-                # read input
-
-                out = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                outaddr = self.resolve_outarg_addr(out,opmode1)
-
-                if len(input_queue) == 0:
-                    # waiting for input...
-                    break
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from intcode import BatchRunner, load_program, parallel_map
 
-                # have enough input
-                self.mem.write(outaddr,input_queue.pop(0))
 
-                self.pc += 2
-
-            elif opcode == 4:
-                # write output
-                in1 = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                arg1 = self.resolve_inarg(in1,opmode1)
-
-                output_queue.append(arg1)
-                self.pc += 2
-
-            elif opcode in [5,6]:
-                if opcode == 5:
-                    # jump-if-true
-                    cond = lambda a: a != 0
-                elif opcode == 6:
-                    # jump-if-false
-                    cond = lambda a: a == 0
-
-                in1 = self.mem.read(self.pc+1)
-                in2 = self.mem.read(self.pc+2)
-
-                opmode1 = opmode % 10
-                opmode2 = (opmode//10) % 10
-
-                arg1    = self.resolve_inarg(in1,opmode1)
-                arg2    = self.resolve_inarg(in2,opmode2)
-
-                if cond(arg1):
-                    self.pc = arg2
-                else:
-                    self.pc += 3
-            elif opcode == 9:
-                in1 = self.mem.read(self.pc+1)
-                opmode1 = opmode % 10
-                arg1 = self.resolve_inarg(in1,opmode1)
-
-                self.relative_base += arg1
-
-                self.pc += 2
-
-            else:
-                raise Exception('invalid opcode {} at {}'.format(opcode, self.pc))
 class Canvas:
     def __init__(self,height,width):
         self.canvas = []
@@ -196,64 +34,195 @@ class Canvas:
     def n_affected(self):
         return len([c for row in self.canvas for c in row if c=='#'])
 
-    def max_square(self):
-        # first '#' in last line
-        lastline = self.canvas[-1]
-        j1st = [j for j,c in enumerate(lastline) if c=='#'][0]
-
-        side=1
-        while self.get([self.height-1-(side), j1st+side]) == '#':
-            side += 1
-
-        for i in range(self.height-side,self.height):
-            for j in range(j1st,j1st+side):
-                self.set([i,j],'O')
-
-        return side,[self.height-side,j1st]
-
-    def compute_beam_coverage(self, prog, compute_slope=False, slope_env=None, truncated_size=None):
+    def compute_beam_coverage(self, prog, compute_slope=False):
 
         if compute_slope:
             maxslope=0
             minslope=1000
 
+        points = []
         for i in range(self.height):
             for j in range(self.width):
+                points.append([i,j])
 
+        outputs = parallel_map(prog,[[j,i] for i,j in points],jit=True)
 
-                if truncated_size and (i<(self.height-truncated_size-1) or j<(self.width-3*truncated_size)):
-                    continue
-
-                if slope_env and i>0:
+        for [i,j],output_pipe in zip(points,outputs):
+            if output_pipe[0]:
+                self.set([i,j],'#')
+                if compute_slope and i>0:
                     slope=(i-j)/i
-                    if slope < slope_env[0] or slope > slope_env[1]:
-                        continue
-
-                computer = IntcodeComputer(prog)
-
-                input_pipe = [j,i]
-                output_pipe = []
-                computer.execute(input_pipe,output_pipe)
-                if output_pipe[0]:
-                    self.set([i,j],'#')
-                    if compute_slope and i>0:
-                        slope=(i-j)/i
-                        maxslope = max(slope,maxslope)
-                        minslope = min(slope,minslope)
-                else:
-                    canvas.set([i,j],'.')
-
-                if not computer.halted:
-                    raise Exception("Excpeted a halt")
+                    maxslope = max(slope,maxslope)
+                    minslope = min(slope,minslope)
+            else:
+                self.set([i,j],'.')
 
         if compute_slope:
             return [minslope, maxslope]
 
-if len(sys.argv) != 2:
+# how much the edges of a row can be off from a straight line, in total
+MAX_ROUNDING = 2
+
+class BeamTracer:
+    # Follows the first and last column of the beam in each row. Both only
+    # move right going down, so a row costs a few probes given the row
+    # above, and rows further down can be found from the slope of the beam.
+    def __init__(self,prog):
+        self.runner = BatchRunner(prog,jit=True)
+        self.edges = {} # row -> [first, last] column of the beam, or None
+        self.last_row = None # furthest row with a non-empty beam
+        self.nprobes = 0
+
+    def probe(self,i,j):
+        self.nprobes += 1
+        return self.runner.run([j,i])[0] == 1
+
+    def set_edges(self,i,edges):
+        self.edges[i] = edges
+        if edges and (self.last_row is None or i > self.last_row):
+            self.last_row = i
+
+    def trace(self,nrows):
+        # rows one at a time, starting from the edges of the row above
+        prev = [0,0]
+        for i in range(nrows):
+            if i in self.edges:
+                if self.edges[i]:
+                    prev = self.edges[i]
+                continue
+
+            # close to the emitter the beam may miss a row completely
+            j1 = prev[0]
+            while j1 <= 10*(i+1) and not self.probe(i,j1):
+                j1 += 1
+            if j1 > 10*(i+1):
+                self.set_edges(i,None)
+                continue
+
+            j2 = max(prev[1],j1)
+            while self.probe(i,j2+1):
+                j2 += 1
+
+            prev = [j1,j2]
+            self.set_edges(i,prev)
+
+    def walk_to_edge(self,i,j,step):
+        # from a guess j, the beam column furthest in direction step
+        if self.probe(i,j):
+            while self.probe(i,j+step):
+                j += step
+            return j
+
+        nsteps = 0
+        while not self.probe(i,j-step):
+            j -= step
+            nsteps += 1
+            if nsteps > i:
+                raise Exception("Lost the beam in row {}".format(i))
+        return j-step
+
+    def get_edges(self,i):
+        if i not in self.edges:
+            # estimate the edges from the slopes at the furthest known row
+            ref = self.last_row
+            j1_ref,j2_ref = self.edges[ref]
+            j1 = self.walk_to_edge(i,(j1_ref*i)//ref,-1)
+            j2 = self.walk_to_edge(i,max(j1,(j2_ref*i)//ref),1)
+            self.set_edges(i,[j1,j2])
+        return self.edges[i]
+
+    def square_slack(self,i,side):
+        # width to spare for a square with its lower left corner at the start
+        # of row i, negative if it does not fit, None if a row has no beam
+        if i < side-1:
+            return None
+        bottom = self.get_edges(i)
+        top = self.get_edges(i-side+1)
+        if bottom is None or top is None:
+            return None
+        return top[1]-bottom[0]+1-side
+
+    def square_fits(self,i,side):
+        slack = self.square_slack(i,side)
+        return slack is not None and slack >= 0
+
+    def find_square(self,side):
+        # first row i where a side x side square fits, with its lower left
+        # corner at the start of row i. Returns its upper left corner.
+        self.trace(max(2*side,50))
+
+        # gallop to a fitting row, then bisect down towards the first one
+        lo = side-2 # no square fits above row side-1
+        step = side
+        hi = lo+step
+        while not self.square_fits(hi,side):
+            lo = hi
+            step *= 2
+            hi = lo+step
+
+        while hi-lo > 1:
+            mid = (lo+hi)//2
+            if self.square_fits(mid,side):
+                hi = mid
+            else:
+                lo = mid
+
+        # whether a square fits is not monotone in the row, since the edges
+        # move in uneven steps, so the bisection may stop at a later fitting
+        # row. The slack grows with the row, up to rounding of each edge, so
+        # walk up until it is short by more than the rounding.
+        first = hi
+        i = hi-1
+        while i >= side-1:
+            slack = self.square_slack(i,side)
+            if slack is not None:
+                if slack >= 0:
+                    first = i
+                elif slack < -MAX_ROUNDING:
+                    break
+            i -= 1
+
+        return [first-side+1, self.get_edges(first)[0]]
+
+def brute_force_square(canvas,side):
+    # first square found by scanning the whole canvas, or None
+    rows = [''.join(line) for line in canvas.canvas]
+    segment = '#'*side
+    for i in range(canvas.height-side+1):
+        j = rows[i].find(segment)
+        while j >= 0:
+            if all(rows[k][j:j+side] == segment for k in range(i,i+side)):
+                return [i,j]
+            j = rows[i].find(segment,j+1)
+    return None
+
+args = sys.argv[1:]
+check = '--check' in args
+if check:
+    args.remove('--check')
+
+if len(args) != 1:
     print("Insufficient arguments!")
     sys.exit(1)
 
-prog = [int(c) for c in open(sys.argv[1]).read().split(',')]
+prog = load_program(args[0])
+
+if check:
+    # compare against scanning the whole grid, for small squares
+    max_side = 20
+    tracer = BeamTracer(prog)
+    found = [tracer.find_square(side) for side in range(1,max_side+1)]
+    size = found[-1][0]+max_side+10
+    canvas = Canvas(size,size)
+    canvas.compute_beam_coverage(prog)
+    nwrong = 0
+    for side,ul in zip(range(1,max_side+1),found):
+        expected = brute_force_square(canvas,side)
+        if ul != expected:
+            print("Side:",side,"Upper left:",ul,"expected",expected)
+            nwrong += 1
+    print("Checked sides 1 to {}, {} wrong".format(max_side,nwrong))
+    sys.exit(1 if nwrong else 0)
 
 ## Part 1
 
@@ -267,22 +236,10 @@ print("Number of affected points:",canvas.n_affected())
 
 ## Part 2
 
-canvas_size = 1340
-slope_env = [0.02, 0.17]
 target_side = 100
-side = target_side
-while True:
-
-    canvas = Canvas(canvas_size,canvas_size)
-    canvas.compute_beam_coverage(prog,slope_env=slope_env,truncated_size=side)
-
-    side,ul = canvas.max_square()
-
-    print("Size:",canvas_size,"Side:",side,"Upper left:",ul)
 
-    if side>=target_side:
-        print("Done!")
-        break
-    # canvas.print()
+tracer = BeamTracer(prog)
+ul = tracer.find_square(target_side)
 
-    canvas_size += 1
+print("Side:",target_side,"Upper left:",ul,"Probes:",tracer.nprobes)
+print("Answer:",ul[1]*10000+ul[0])
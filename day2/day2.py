@@ -1,72 +1,85 @@
 
+import os
 import sys
+from collections import deque
 
-def execute(state):
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from intcode import IntcodeComputer, load_program, parallel_find
 
-    pc = 0
+def prepare_state(computer,noun,verb):
+    computer.write(1,noun)
+    computer.write(2,verb)
 
-    while True:
-        opcode = state[pc]
-
-        if opcode == 99:
-            break
-        if opcode == 1:
-            operation = lambda a,b: a+b
-        elif opcode == 2:
-            operation = lambda a,b: a*b
-        else:
-            raise Exception('invalid opcode {} at {}'.format(opcode, pc))
-
-        in1addr = state[pc+1]
-        in2addr = state[pc+2]
-        outaddr = state[pc+3]
-
-        state[outaddr] = operation(state[in1addr],state[in2addr])
-
-        pc += 4
-
-def prepare_state(state,noun,verb):
-    state[1] = noun
-    state[2] = verb
+def run_noun_verb(computer,noun_verb):
+    noun,verb = noun_verb
+    prepare_state(computer,noun,verb)
+    computer.execute(deque(),deque())
+    return computer.mem.read(0)
 
 def compute_output(initial_state,noun,verb):
-    state = list(initial_state)
-    prepare_state(state,noun,verb)
-    execute(state)
-    return state[0]
-
-def look_for_output(initial_state,desired_output):
-    for noun in range(0,100):
-        for verb in range(0,100):
-            output = compute_output(state,noun,verb)
-            print("Testing nount={}, verb={}...".format(noun,verb))
-            if output == desired_output:
-                return noun,verb
-    raise Exception("No pairs noun,verb gave the desired output {}".format(desired_output))
+    return run_noun_verb(IntcodeComputer(initial_state),[noun,verb])
+
+def look_for_output(initial_state,desired_output,nmax=100):
+    pairs = [[noun,verb] for noun in range(0,nmax) for verb in range(0,nmax)]
+    found = parallel_find(initial_state,pairs,lambda output: output == desired_output,run=run_noun_verb)
+    if found is None:
+        raise Exception("No pairs noun,verb gave the desired output {}".format(desired_output))
+    noun,verb = found[0]
+    return noun,verb
+
+def fit_affine(initial_state,nmax=100):
+    # coefficients (c,a,b) such that the output is c + a*noun + b*verb, or
+    # None if the program does not behave like that
+    c = compute_output(initial_state,0,0)
+    a = compute_output(initial_state,1,0)-c
+    b = compute_output(initial_state,0,1)-c
+
+    for noun,verb in [(1,1),(nmax-1,nmax-1),(nmax-1,0),(0,nmax-1),(nmax//2+1,nmax//3+1)]:
+        if compute_output(initial_state,noun,verb) != c+a*noun+b*verb:
+            return None
+    return c,a,b
+
+def invert_affine(fit,desired_output,nmax=100):
+    # the first pair in the order of the search giving the desired output
+    # according to the fit, or None
+    c,a,b = fit
+    for noun in range(0,nmax):
+        rest = desired_output-c-a*noun
+        if b == 0:
+            if rest == 0:
+                return noun,0
+        elif rest % b == 0 and 0 <= rest//b < nmax:
+            return noun,rest//b
+    return None
+
+def solve_for_output(initial_state,desired_output,nmax=100):
+    # invert the affine fit if there is one, else search all pairs
+    fit = fit_affine(initial_state,nmax)
+    if fit is None:
+        print("Output not affine in noun and verb, searching")
+        return look_for_output(initial_state,desired_output,nmax)
+
+    # the fit is only checked at a few points, so run the pair it gives
+    found = invert_affine(fit,desired_output,nmax)
+    if found is None or compute_output(initial_state,*found) != desired_output:
+        print("Affine fit does not hold, searching")
+        return look_for_output(initial_state,desired_output,nmax)
+    return found
 
 
 if len(sys.argv) != 2:
     print("need input!")
     sys.exit(1)
 
-data = open(sys.argv[1]).read()
-
-state = list(map(int,data.split(',')))
+state = load_program(sys.argv[1])
 
 ## Part 1
-# print("-- Initial state --")
-# print(state)
-# prepare_state(state,12,2)
-# print("-- Prepared state --")
-# print(state)
-# execute(state)
-# print("-- Final state --")
-# print(state)
+# print("Output for noun=12, verb=2:",compute_output(state,12,2))
 
 ## Part 2
 desired_output = 19690720
 
-noun,verb = look_for_output(state,desired_output)
+noun,verb = solve_for_output(state,desired_output)
 
 print()
 print("Found input (noun={}, verb={}) yielding output {}".format(noun,verb,desired_output))
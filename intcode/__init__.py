@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)__init__.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+from .memory import Memory
+from .loader import load_program
+from .computer import IntcodeComputer
+from .jit import RUNNING, WAITING, HALTED
+from .batch import BatchRunner, run_batch
+from .pipes import drain, drain_records
+from .parallel import parallel_map, parallel_find
+from .aio import run_async, run_pipeline
+from .profiler import Profiler
+from .disasm import build_cfg, disassemble
+from .ascii import AsciiDecoder
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)__main__.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+# python -m intcode <program> [<input> ...] [--profile] [--folded <file>]
+# python -m intcode <program> --disasm
+
+import sys
+from collections import deque
+
+from . import IntcodeComputer, Profiler, disassemble, load_program
+
+args = sys.argv[1:]
+
+folded = None
+if '--folded' in args:
+    k = args.index('--folded')
+    folded = args[k+1]
+    del args[k:k+2]
+
+profile = folded is not None
+if '--profile' in args:
+    args.remove('--profile')
+    profile = True
+
+if len(args) < 1:
+    print("Insufficient arguments!")
+    sys.exit(1)
+
+prog = load_program(args[0])
+
+if '--disasm' in args:
+    print(disassemble(prog))
+    sys.exit(0)
+
+profiler = Profiler() if profile else None
+computer = IntcodeComputer(prog,profiler=profiler)
+output_pipe = deque()
+computer.execute(deque(int(a) for a in args[1:]),output_pipe)
+
+print("Output:",list(output_pipe))
+print("Halted:",computer.halted)
+
+if profiler:
+    print()
+    print(profiler.report())
+
+if folded:
+    profiler.write_folded(folded)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)aio.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+# Runs computers as asyncio coroutines connected by asyncio.Queue channels.
+# A computer runs until it needs input it does not have, and then awaits
+# its input queue, so the event loop only resumes machines that can make
+# progress. Output is put on the output queue as soon as it is produced,
+# which requires the queue to be unbounded.
+
+import asyncio
+from collections import deque
+
+class QueueWriter:
+    # output pipe for the computer, passing values on to an asyncio.Queue
+    def __init__(self,queue):
+        self.append = queue.put_nowait
+
+async def run_async(computer,input_queue,output_queue,on_wait=None):
+    input_pipe = deque()
+    output_pipe = QueueWriter(output_queue)
+
+    while True:
+        computer.execute(input_pipe,output_pipe)
+
+        if computer.halted:
+            return
+
+        # waiting for input, take all there is once something arrives
+        if on_wait:
+            on_wait(True)
+        input_pipe.append(await input_queue.get())
+        if on_wait:
+            on_wait(False)
+        while not input_queue.empty():
+            input_pipe.append(input_queue.get_nowait())
+
+async def run_pipeline(computers,queues):
+    # computers[i] reads queues[i] and writes queues[i+1]. Giving one
+    # queue more than there are computers makes an open chain, while as
+    # many queues as computers wraps the last output around to the first.
+
+    closed = len(queues) == len(computers)
+
+    def check_deadlock():
+        # in a closed loop nothing can feed the pipeline from outside, so if
+        # every running computer waits on an empty queue, none of them will
+        # ever resume. The first queue of an open chain may be fed by anyone.
+        if not closed or all(comp.halted for comp in computers):
+            return
+        for i,comp in enumerate(computers):
+            if not comp.halted and (not queues[i].empty() or not waiting[i]):
+                return
+        raise Exception("All computers in the pipeline are waiting for input")
+
+    waiting = [False]*len(computers)
+
+    async def run(i,comp):
+        def on_wait(is_waiting):
+            waiting[i] = is_waiting
+            if is_waiting:
+                check_deadlock()
+        output_queue = queues[(i+1)%len(queues)]
+        await run_async(comp,queues[i],output_queue,on_wait)
+        # the others may be waiting for input that this one will never give
+        check_deadlock()
+
+    tasks = [asyncio.ensure_future(run(i,comp)) for i,comp in enumerate(computers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)ascii.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+# Decodes ASCII output as it is produced. An AsciiDecoder is passed to the
+# computer as its output pipe, and each value goes straight into a grid of
+# bytearray rows, one per line, which can be modified in place. Values
+# outside the ASCII range, typically the answer at the end, are kept apart.
+
+NEWLINE = 10
+
+class AsciiDecoder:
+    def __init__(self):
+        # the last row is the line in progress
+        self.rows = [bytearray()]
+        self.values = []
+
+    def append(self,value):
+        if value == NEWLINE:
+            self.rows.append(bytearray())
+        elif 0 <= value < 128:
+            self.rows[-1].append(value)
+        else:
+            self.values.append(value)
+
+    def extend(self,values):
+        for value in values:
+            self.append(value)
+
+    def lines(self):
+        # complete lines
+        return self.rows[:-1]
+
+    def text(self):
+        return '\n'.join(row.decode() for row in self.rows)
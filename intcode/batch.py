@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)batch.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+from collections import deque
+
+from .memory import Memory
+from .computer import IntcodeComputer
+
+def run_to_halt(computer,input_pipe):
+    output_pipe = deque()
+    computer.execute(deque(input_pipe),output_pipe)
+
+    if not computer.halted:
+        raise Exception("Computer waiting for input after {}".format(input_pipe))
+
+    return list(output_pipe)
+
+class BatchRunner:
+    # runs jobs on a single computer that is reset to the pristine image
+    # before each job. A job is by default a list of inputs, giving the
+    # list of outputs, but any run(computer,job) function can be used.
+    def __init__(self,prog,run=run_to_halt,jit=False):
+        self.image = prog if isinstance(prog,Memory) else Memory(prog)
+        self.computer = IntcodeComputer(prog,jit=jit)
+        self.run_job = run
+
+    def run(self,job):
+        self.computer.reset(self.image)
+        return self.run_job(self.computer,job)
+
+def run_batch(prog,inputs,run=run_to_halt,jit=False):
+    runner = BatchRunner(prog,run,jit)
+    return [runner.run(job) for job in inputs]
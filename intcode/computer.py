@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)computer.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+from .memory import Memory
+from .jit import RUNNING, WAITING, HALTED, compile_block
+from .opcodes import instruction_formats, instruction_format
+from .opcodes import MOVE, CMP_JUMP, PUSH_CALL, ARB_JUMP
+from .profiler import execute_profiled
+
+def is_unconditional_jump(entry):
+    opcode,m1,a1 = entry[:3]
+    return (opcode == 5 or opcode == 6) and m1 == 1 and (a1 != 0) == (opcode == 5)
+
+class IntcodeComputer:
+    # number of computers constructed, forks not included
+    nconstructed = 0
+    # profiler used by computers constructed without one
+    default_profiler = None
+
+    def __init__(self,state,jit=False,profiler=None):
+        IntcodeComputer.nconstructed += 1
+        if profiler is None:
+            profiler = IntcodeComputer.default_profiler
+
+        if isinstance(state,Memory):
+            # a loaded image, shared and kept pristine
+            self.mem = state.copy()
+        else:
+            self.mem = Memory(state)
+        self.pc = 0
+        self.relative_base = 0
+        self.halted = False
+        # address to write the next input to, when waiting for input in
+        # the interpreter
+        self.input_addr = None
+        self.jit = jit
+        # when set, execution goes through the instrumented interpreter
+        self.profiler = profiler
+
+        # decode cache, pc -> (opcode,mode1,arg1,mode2,arg2,mode3,arg3)
+        self.decoded = {}
+        # entries of the interpreter, where common instruction pairs are
+        # fused into one, pc -> entry
+        self.fused = {}
+        # address -> set of pcs of decoded instructions covering it
+        self.code_map = {}
+        # compiled blocks, entry pc -> function
+        self.blocks = {}
+        # entry pcs of blocks that cannot be compiled, as the instruction
+        # there has been modified
+        self.modified_code = set()
+        # addresses written to while decoded or compiled as code
+        self.volatile_code = set()
+        # number of times each entry pc not yet compiled has been reached
+        self.heat = {}
+        # (pc,start,end) of code decoded or compiled since the last reset, a set
+        # as modified code may be decoded again and again
+        self.new_code = set()
+
+    def write(self,addr,data):
+        # write to memory from outside, keeping decoded code up to date
+        if addr in self.code_map:
+            self.invalidate(addr)
+        self.mem.write(addr,data)
+
+    def fork(self):
+        # independent copy of a paused computer, to continue from the same
+        # state along different paths
+        comp = IntcodeComputer.__new__(IntcodeComputer)
+        comp.mem = self.mem.copy()
+        comp.pc = self.pc
+        comp.relative_base = self.relative_base
+        comp.halted = self.halted
+        comp.input_addr = self.input_addr
+        comp.jit = self.jit
+        comp.profiler = self.profiler
+        comp.decoded = dict(self.decoded)
+        comp.fused = dict(self.fused)
+        comp.code_map = {addr:set(pcs) for addr,pcs in self.code_map.items()}
+        comp.blocks = dict(self.blocks)
+        comp.modified_code = set(self.modified_code)
+        comp.volatile_code = set(self.volatile_code)
+        comp.heat = dict(self.heat)
+        comp.new_code = set(self.new_code)
+        return comp
+
+    def snapshot(self):
+        # a fork kept aside, which can be restored any number of times
+        return self.fork()
+
+    def restore(self,snapshot):
+        self.__dict__.update(snapshot.fork().__dict__)
+
+    def reset(self,image):
+        # restart from a pristine memory image, keeping the decoded code.
+        # Code written to after decoding has already been invalidated, so
+        # only code decoded during this run can differ from the image.
+        for pc,start,end in self.new_code:
+            if self.mem.slice(start,end) != image.slice(start,end):
+                self.decoded.pop(pc,None)
+                self.fused.pop(pc,None)
+                self.blocks.pop(pc,None)
+
+        self.mem.reset(image)
+        self.pc = 0
+        self.relative_base = 0
+        self.halted = False
+        self.input_addr = None
+        self.new_code = set()
+
+    def decode(self,pc):
+        read = self.mem.read
+        instr = read(pc)
+
+        fmt = instruction_formats.get(instr)
+        if fmt is None:
+            fmt = instruction_format(instr,pc)
+        opcode,nparams,m1,m2,m3 = fmt
+
+        if nparams == 3:
+            entry = (opcode,m1,read(pc+1),m2,read(pc+2),m3,read(pc+3))
+        elif nparams == 2:
+            entry = (opcode,m1,read(pc+1),m2,read(pc+2),0,0)
+        elif nparams == 1:
+            entry = (opcode,m1,read(pc+1),0,0,0,0)
+        else:
+            entry = (opcode,0,0,0,0,0,0)
+
+        self.decoded[pc] = entry
+        self.register_code(pc,pc,pc+1+nparams)
+
+        return entry
+
+    def peek(self,pc):
+        # decoded entry at pc, or None if it is not a valid instruction
+        entry = self.decoded.get(pc)
+        if entry is None:
+            try:
+                entry = self.decode(pc)
+            except Exception:
+                return None
+        return entry
+
+    def fuse(self,pc):
+        # interpreter entry at pc. Moves get their own handler, and so do
+        # compare-and-branch, push-and-call and return sequences, which are
+        # fused into one entry. A fused entry covers the code of both
+        # instructions, so it is dropped when either is modified.
+        entry = self.decoded.get(pc)
+        if entry is None:
+            entry = self.decode(pc)
+        opcode,m1,a1,m2,a2,m3,a3 = entry
+
+        if opcode == 1 or opcode == 2:
+            unit = 0 if opcode == 1 else 1
+            if m2 == 1 and a2 == unit:
+                entry = (MOVE,m1,a1,0,0,m3,a3)
+            elif m1 == 1 and a1 == unit:
+                entry = (MOVE,m2,a2,0,0,m3,a3)
+            if entry[0] == MOVE:
+                jump = self.peek(pc+4)
+                if jump is not None and is_unconditional_jump(jump):
+                    entry = (PUSH_CALL,entry[1],entry[2],m3,a3,jump[3],jump[4])
+                    self.register_code(pc,pc+4,pc+7)
+
+        elif opcode == 7 or opcode == 8:
+            jump = self.peek(pc+4)
+            if jump is not None and (jump[0] == 5 or jump[0] == 6) and jump[1:3] == (m3,a3):
+                # the last argument holds the rest of the pair
+                entry = (CMP_JUMP,m1,a1,m2,a2,m3,(a3,opcode == 8,jump[0] == 5,jump[3],jump[4]))
+                self.register_code(pc,pc+4,pc+7)
+
+        elif opcode == 9:
+            jump = self.peek(pc+2)
+            if jump is not None and is_unconditional_jump(jump):
+                entry = (ARB_JUMP,m1,a1,0,0,jump[3],jump[4])
+                self.register_code(pc,pc+2,pc+5)
+
+        self.fused[pc] = entry
+        return entry
+
+    def register_code(self,pc,start,end):
+        # note that the code at start:end has been decoded or compiled
+        # into the entry at pc
+        code_map = self.code_map
+        for addr in range(start,end):
+            pcs = code_map.get(addr)
+            if pcs is None:
+                code_map[addr] = {pc}
+            else:
+                pcs.add(pc)
+        self.new_code.add((pc,start,end))
+
+    def invalidate(self,addr):
+        # drop all decoded instructions overlapping a modified address. Blocks
+        # compiled again read the address from memory.
+        self.volatile_code.add(addr)
+        for pc in self.code_map.pop(addr,()):
+            if pc == self.pc:
+                # the pending input instruction, if any, has changed
+                self.input_addr = None
+            self.decoded.pop(pc,None)
+            self.fused.pop(pc,None)
+            self.blocks.pop(pc,None)
+
+    def execute(self, input_queue, output_queue):
+        # run until halted or waiting for input, returning HALTED or WAITING.
+        # The queues are deques, input is consumed from the left
+        return self.run(input_queue, output_queue)
+
+    def step_until_output(self, input_queue, output_queue, n=1):
+        # run until n more outputs have been produced, returning RUNNING, or
+        # until halted or waiting for input before that
+        return self.run(input_queue, output_queue, n)
+
+    def run(self, input_queue, output_queue, max_outputs=None):
+
+        if self.halted:
+            raise Exception("Cannot execute computer, already halted")
+
+        if self.input_addr is not None:
+            # resume the pending input instruction directly
+            if len(input_queue) == 0:
+                return WAITING
+            addr = self.input_addr
+            self.input_addr = None
+            self.write(addr,input_queue.popleft())
+            self.pc += 2
+
+        if self.profiler is not None:
+            return execute_profiled(self, input_queue, output_queue, max_outputs)
+        elif self.jit and max_outputs is None:
+            return self.execute_compiled(input_queue, output_queue)
+        else:
+            return self.interpret(input_queue, output_queue, max_outputs=max_outputs)
+
+    def execute_compiled(self, input_queue, output_queue):
+
+        read = self.mem.read
+        write = self.mem.write
+        code_map = self.code_map
+        invalidate = self.invalidate
+        blocks = self.blocks
+
+        pc = self.pc
+        rb = self.relative_base
+
+        while True:
+
+            block = blocks.get(pc)
+            if block is None:
+                if pc not in self.modified_code:
+                    block = compile_block(self,pc)
+
+                if block is None:
+                    # cold or modified code, interpret up to the next jump
+                    self.pc = pc
+                    self.relative_base = rb
+                    status = self.interpret(input_queue, output_queue, stop_at_jump=True)
+                    if status != RUNNING:
+                        return status
+                    pc = self.pc
+                    rb = self.relative_base
+                    continue
+
+                blocks[pc] = block
+
+            pc,rb,status = block(read,write,code_map,invalidate,rb,input_queue,output_queue)
+
+            if status != RUNNING:
+                if status == HALTED:
+                    self.halted = True
+                break
+
+        self.pc = pc
+        self.relative_base = rb
+        return status
+
+    def interpret(self, input_queue, output_queue, stop_at_jump=False, max_outputs=None):
+        # returns RUNNING when stopped at a jump or after max_outputs outputs
+
+        read = self.mem.read
+        write = self.mem.write
+        code_map = self.code_map
+        # the fused entries are only used when running freely, as they may
+        # contain jumps
+        if stop_at_jump:
+            entries = self.decoded
+            decode = self.decode
+        else:
+            entries = self.fused
+            decode = self.fuse
+
+        # base address per parameter mode, the immediate entry is never used
+        bases = [0, 0, self.relative_base]
+        pc = self.pc
+
+        while True:
+
+            entry = entries.get(pc)
+            if entry is None:
+                self.pc = pc
+                entry = decode(pc)
+
+            opcode,m1,a1,m2,a2,m3,a3 = entry
+
+            if opcode == 1 or opcode == 2 or opcode == 7 or opcode == 8:
+                arg1 = a1 if m1 == 1 else read(bases[m1]+a1)
+                arg2 = a2 if m2 == 1 else read(bases[m2]+a2)
+
+                if opcode == 1:
+                    # add
+                    result = arg1+arg2
+                elif opcode == 2:
+                    # multiply
+                    result = arg1*arg2
+                elif opcode == 7:
+                    # less-than
+                    result = 1 if arg1<arg2 else 0
+                else:
+                    # equals
+                    result = 1 if arg1==arg2 else 0
+
+                outaddr = bases[m3]+a3
+                if outaddr in code_map:
+                    self.invalidate(outaddr)
+                write(outaddr,result)
+
+                pc += 4
+
+            elif opcode == MOVE:
+                outaddr = bases[m3]+a3
+                if outaddr in code_map:
+                    self.invalidate(outaddr)
+                write(outaddr,a1 if m1 == 1 else read(bases[m1]+a1))
+                pc += 4
+
+            elif opcode == CMP_JUMP:
+                a3,equals,jump_if,mt,at = a3
+                arg1 = a1 if m1 == 1 else read(bases[m1]+a1)
+                arg2 = a2 if m2 == 1 else read(bases[m2]+a2)
+                result = arg1 == arg2 if equals else arg1 < arg2
+
+                outaddr = bases[m3]+a3
+                if outaddr in code_map:
+                    # the jump may have been modified, leave it to the
+                    # next iteration
+                    self.invalidate(outaddr)
+                    write(outaddr,1 if result else 0)
+                    pc += 4
+                    continue
+                write(outaddr,1 if result else 0)
+
+                if result == jump_if:
+                    pc = at if mt == 1 else read(bases[mt]+at)
+                else:
+                    pc += 7
+
+            elif opcode == 5 or opcode == 6:
+                # jump-if-true / jump-if-false
+                arg1 = a1 if m1 == 1 else read(bases[m1]+a1)
+
+                if (arg1 != 0) == (opcode == 5):
+                    pc = a2 if m2 == 1 else read(bases[m2]+a2)
+                else:
+                    pc += 3
+
+                if stop_at_jump:
+                    status = RUNNING
+                    break
+
+            elif opcode == 3:
+                # read input
+                if len(input_queue) == 0:
+                    # waiting for input...
+                    self.input_addr = bases[m1]+a1
+                    status = WAITING
+                    break
+
+                outaddr = bases[m1]+a1
+                if outaddr in code_map:
+                    self.invalidate(outaddr)
+                write(outaddr,input_queue.popleft())
+
+                pc += 2
+
+            elif opcode == 4:
+                # write output
+                output_queue.append(a1 if m1 == 1 else read(bases[m1]+a1))
+                pc += 2
+
+                if max_outputs is not None:
+                    max_outputs -= 1
+                    if max_outputs == 0:
+                        status = RUNNING
+                        break
+
+            elif opcode == 9:
+                # adjust relative base
+                bases[2] += a1 if m1 == 1 else read(bases[m1]+a1)
+                pc += 2
+
+            elif opcode == PUSH_CALL:
+                outaddr = bases[m2]+a2
+                if outaddr in code_map:
+                    self.invalidate(outaddr)
+                    write(outaddr,a1 if m1 == 1 else read(bases[m1]+a1))
+                    pc += 4
+                    continue
+                write(outaddr,a1 if m1 == 1 else read(bases[m1]+a1))
+                pc = a3 if m3 == 1 else read(bases[m3]+a3)
+
+            elif opcode == ARB_JUMP:
+                bases[2] += a1 if m1 == 1 else read(bases[m1]+a1)
+                pc = a3 if m3 == 1 else read(bases[m3]+a3)
+
+            else:
+                # halt
+                self.halted = True
+                status = HALTED
+                break
+
+        self.pc = pc
+        self.relative_base = bases[2]
+        return status
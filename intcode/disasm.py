@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)disasm.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+# Static views of a program image: the basic blocks reachable from the entry
+# point with the control flow between them, and a mnemonic listing. Nothing is
+# executed, so jumps through memory are only followed where they return from a
+# call, i.e. where a constant return address is pushed right before an
+# unconditional jump.
+
+from .opcodes import MNEMONICS, OUTPUT_OPCODES, instruction_formats, instruction_format
+
+def decode(image,pc):
+    # (opcode,[(mode,arg),...]) of the instruction at pc
+    instr = image.read(pc)
+    fmt = instruction_formats.get(instr)
+    if fmt is None:
+        fmt = instruction_format(instr,pc)
+    opcode,nparams = fmt[:2]
+    return opcode,[(fmt[2+k],image.read(pc+1+k)) for k in range(nparams)]
+
+def is_jump(opcode):
+    return opcode == 5 or opcode == 6
+
+def is_unconditional(opcode,params):
+    mode,arg = params[0]
+    return mode == 1 and (arg != 0) == (opcode == 5)
+
+def jump_target(params):
+    mode,arg = params[1]
+    return arg if mode == 1 else None
+
+def pushed_constant(opcode,params):
+    # constant written to the stack by a move, add x,0 or mul x,1
+    if opcode not in [1,2] or params[2][0] != 2:
+        return None
+    (m1,a1),(m2,a2) = params[:2]
+    if m1 != 1 or m2 != 1:
+        return None
+    unit = 0 if opcode == 1 else 1
+    if a2 == unit:
+        return a1
+    if a1 == unit:
+        return a2
+    return None
+
+class BasicBlock:
+    def __init__(self,start):
+        self.start = start
+        # pc after the last instruction
+        self.end = start
+        # (pc,opcode,params)
+        self.instructions = []
+        self.successors = []
+        # ends with a jump to an address read from memory
+        self.indirect = False
+        # (pc,addr) of writes to a fixed address holding code
+        self.code_writes = []
+        # pcs of writes to addresses relative to the relative base
+        self.relative_writes = []
+
+def find_instructions(image,entries):
+    # pc -> (opcode,params) of everything reachable, the leaders, and the
+    # reachable pcs not holding a valid instruction, which are typically
+    # patched by the program before getting there
+    instructions = {}
+    invalid = set()
+    leaders = set(entries)
+    worklist = list(entries)
+    while worklist:
+        pc = worklist.pop()
+        pushed = None
+        while pc not in instructions and 0 <= pc < len(image):
+            try:
+                opcode,params = decode(image,pc)
+            except Exception:
+                invalid.add(pc)
+                break
+            instructions[pc] = (opcode,params)
+            next_pc = pc+1+len(params)
+
+            if opcode == 99:
+                break
+            if is_jump(opcode):
+                leaders.add(next_pc)
+                target = jump_target(params)
+                if target is not None:
+                    leaders.add(target)
+                    worklist.append(target)
+                if is_unconditional(opcode,params):
+                    if pushed is not None and target is not None:
+                        # a call, which returns to the pushed address
+                        leaders.add(pushed)
+                        worklist.append(pushed)
+                    break
+
+            pushed = pushed_constant(opcode,params)
+            pc = next_pc
+
+    return instructions,leaders,invalid
+
+def build_cfg(image,entries=(0,)):
+    # basic blocks reachable from the entries, start pc -> BasicBlock
+    instructions,leaders,invalid = find_instructions(image,entries)
+
+    code = set(invalid)
+    for pc,(opcode,params) in instructions.items():
+        code.update(range(pc,pc+1+len(params)))
+
+    blocks = {}
+    for start in sorted(leaders):
+        if start not in instructions:
+            continue
+        block = BasicBlock(start)
+        blocks[start] = block
+
+        pc = start
+        while True:
+            opcode,params = instructions[pc]
+            block.instructions.append((pc,opcode,params))
+            pc += 1+len(params)
+
+            if opcode in OUTPUT_OPCODES:
+                mode,addr = params[-1]
+                if mode == 2:
+                    block.relative_writes.append(pc-1-len(params))
+                elif addr in code:
+                    block.code_writes.append((pc-1-len(params),addr))
+
+            if opcode == 99:
+                break
+            if is_jump(opcode):
+                target = jump_target(params)
+                if target is None:
+                    block.indirect = True
+                elif target in instructions:
+                    block.successors.append(target)
+                if not is_unconditional(opcode,params) and pc in instructions:
+                    block.successors.append(pc)
+                break
+            if pc in leaders or pc not in instructions:
+                if pc in instructions:
+                    block.successors.append(pc)
+                break
+
+        block.end = pc
+
+    return blocks
+
+def code_writes(blocks):
+    # (pc,addr) of all writes to a fixed address holding code
+    return [write for block in blocks.values() for write in block.code_writes]
+
+def format_param(mode,arg):
+    if mode == 0:
+        return '[{}]'.format(arg)
+    elif mode == 1:
+        return str(arg)
+    else:
+        return '[rb{:+d}]'.format(arg)
+
+def format_instruction(pc,opcode,params):
+    args = ', '.join(format_param(m,a) for m,a in params)
+    return '{:8d}  {:<4s} {}'.format(pc,MNEMONICS[opcode],args).rstrip()
+
+def disassemble(image,blocks=None):
+    # listing of the reachable blocks, with the words in between as data
+    if blocks is None:
+        blocks = build_cfg(image)
+
+    writes = code_writes(blocks)
+    lines = []
+    if writes:
+        lines.append('; {} writes to code, not safe to pre-decode'.format(len(writes)))
+    else:
+        lines.append('; no writes to code at fixed addresses')
+    written = set(addr for pc,addr in writes)
+
+    pc = 0
+    for start in sorted(blocks):
+        if pc < start:
+            lines.append('')
+            lines += format_data(image,pc,start)
+        block = blocks[start]
+
+        lines.append('')
+        header = 'block {}'.format(start)
+        if block.successors:
+            header += ' -> {}'.format(', '.join(str(s) for s in block.successors))
+        if block.indirect:
+            header += ' (indirect)'
+        lines.append(header)
+
+        modifying = dict(block.code_writes)
+        for ipc,opcode,params in block.instructions:
+            line = format_instruction(ipc,opcode,params)
+            comments = []
+            if ipc in modifying:
+                comments.append('writes code at {}'.format(modifying[ipc]))
+            if any(addr in written for addr in range(ipc,ipc+1+len(params))):
+                comments.append('modified')
+            if comments:
+                line = '{:<40s}; {}'.format(line,', '.join(comments))
+            lines.append(line)
+        pc = max(pc,block.end)
+
+    if pc < len(image):
+        lines.append('')
+        lines += format_data(image,pc,len(image))
+
+    return '\n'.join(lines)
+
+def format_data(image,start,end,nwords=8):
+    lines = []
+    for pc in range(start,end,nwords):
+        words = image.slice(pc,min(pc+nwords,end))
+        lines.append('{:8d}  data {}'.format(pc,', '.join(str(w) for w in words)))
+    return lines
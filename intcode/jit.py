@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)jit.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+# Translates Intcode into Python functions. A basic block starts at a pc and
+# ends at the first jump, halt or invalid opcode. A compiled block covers the
+# region of basic blocks reachable from its entry pc through jumps to
+# constant addresses, and loops within the region without returning to the
+# computer. Each block function takes the memory accessors, the relative
+# base and the I/O queues, and returns (next_pc, relative_base, status) once
+# execution leaves the region, waits for input, halts or modifies code.
+#
+# Code words are compiled in as constants. Words that have been written to
+# while compiled, typically arguments used as variables, are read from
+# memory instead when the region is compiled again.
+
+from .opcodes import instruction_formats, instruction_format
+
+RUNNING = 0
+WAITING = 1
+HALTED = 2
+
+# maximum number of instructions in a basic block
+MAX_BLOCK_LENGTH = 100
+
+# maximum number of basic blocks in a region
+MAX_REGION_BLOCKS = 64
+
+# number of times a computer reaches an entry pc before compiling it, so that
+# code run only once is interpreted
+HOT_THRESHOLD = 2
+
+# compiled blocks shared between computers running the same program,
+# entry pc -> list of (spans of code, {code words: function}). The code
+# words of a block are only known once its spans are, and they are usually
+# the same for every variant of an entry.
+compiled_blocks = {}
+
+# maximum number of variants of an entry kept in compiled_blocks. Code
+# patched before it runs, e.g. by computer.write, differs between runs and
+# is not worth sharing.
+MAX_SHARED_VARIANTS = 8
+
+def inarg_expr(mode,arg):
+    if mode == 1:
+        return str(arg)
+    elif mode == 0:
+        return 'read({})'.format(arg)
+    else:
+        return 'read(rb+{})'.format(arg)
+
+def outaddr_expr(mode,arg):
+    if mode == 0:
+        return str(arg)
+    else:
+        return 'rb+{}'.format(arg)
+
+def decode_args(computer,pc):
+    # (opcode,[(mode,arg,constant)...]) of the instruction at pc, where arg
+    # is the expression for the argument and constant its value, or None if
+    # it is volatile and read at run time. Unlike computer.decode, nothing
+    # is registered as code.
+    read = computer.mem.read
+    instr = read(pc)
+    fmt = instruction_formats.get(instr)
+    if fmt is None:
+        fmt = instruction_format(instr,pc)
+    opcode,nparams = fmt[:2]
+
+    args = []
+    for k in range(nparams):
+        addr = pc+1+k
+        if addr in computer.volatile_code:
+            args.append((fmt[2+k],'read({})'.format(addr),None))
+        else:
+            value = read(addr)
+            args.append((fmt[2+k],value,value))
+    return opcode,args
+
+def emit_write(lines,addr,value,next_pc):
+    # any write landing on decoded or compiled code leaves the region, as the
+    # rest of it may be stale
+    lines.append('a = {}'.format(addr))
+    lines.append('write(a,{})'.format(value))
+    lines.append('if a in code_map:')
+    lines.append('    invalidate(a)')
+    lines.append('    return {},rb,RUNNING'.format(next_pc))
+
+def emit_goto(lines,pc):
+    lines.append('pc = {}'.format(pc))
+    lines.append('continue')
+
+def add_span(spans,start,end,volatile_code):
+    # the constant words of start:end, split around volatile ones
+    for addr in range(start,end):
+        if addr in volatile_code:
+            continue
+        if spans and spans[-1][1] == addr:
+            spans[-1] = (spans[-1][0],addr+1)
+        else:
+            spans.append((addr,addr+1))
+
+def generate_basic_block(computer,start_pc,spans):
+    # (lines,successors) of the basic block at start_pc, where the successors
+    # are the addresses it may continue at that are known statically. The
+    # constant code is added to spans. The lines are None if start_pc is not
+    # a valid instruction.
+    lines = []
+    successors = []
+
+    pc = start_pc
+    ninstr = 0
+    while True:
+        if ninstr == MAX_BLOCK_LENGTH:
+            emit_goto(lines,pc)
+            successors.append(pc)
+            break
+
+        if pc in computer.volatile_code:
+            # the instruction itself is modified, leave it to the interpreter
+            if ninstr == 0:
+                return None,[]
+            lines.append('return {},rb,RUNNING'.format(pc))
+            break
+
+        try:
+            opcode,args = decode_args(computer,pc)
+        except Exception:
+            if ninstr == 0:
+                return None,[]
+            # leave the invalid instruction to the interpreter
+            lines.append('return {},rb,RUNNING'.format(pc))
+            break
+
+        ninstr += 1
+        add_span(spans,pc,pc+1+len(args),computer.volatile_code)
+
+        if opcode in [1,2,7,8]:
+            (m1,a1,_),(m2,a2,_),(m3,a3,_) = args
+            x = inarg_expr(m1,a1)
+            y = inarg_expr(m2,a2)
+            if opcode == 1:
+                value = '{}+{}'.format(x,y)
+            elif opcode == 2:
+                value = '{}*{}'.format(x,y)
+            elif opcode == 7:
+                value = '1 if {}<{} else 0'.format(x,y)
+            else:
+                value = '1 if {}=={} else 0'.format(x,y)
+            emit_write(lines,outaddr_expr(m3,a3),value,pc+4)
+            pc += 4
+
+        elif opcode == 3:
+            (m1,a1,_), = args
+            lines.append('if len(input_queue) == 0:')
+            lines.append('    return {},rb,WAITING'.format(pc))
+            emit_write(lines,outaddr_expr(m1,a1),'input_queue.popleft()',pc+2)
+            pc += 2
+
+        elif opcode == 4:
+            (m1,a1,_), = args
+            lines.append('output_queue.append({})'.format(inarg_expr(m1,a1)))
+            pc += 2
+
+        elif opcode == 9:
+            (m1,a1,_), = args
+            lines.append('rb += {}'.format(inarg_expr(m1,a1)))
+            pc += 2
+
+        elif opcode == 5 or opcode == 6:
+            (m1,a1,c1),(m2,a2,c2) = args
+            cond = '!=' if opcode == 5 else '=='
+            lines.append('if {} {} 0:'.format(inarg_expr(m1,a1),cond))
+            lines.append('    pc = {}'.format(inarg_expr(m2,a2)))
+            lines.append('    continue')
+            if m2 == 1 and c2 is not None:
+                successors.append(c2)
+            pc += 3
+            if m1 == 1 and c1 is not None and (c1 != 0) == (opcode == 5):
+                # unconditional, nothing to fall through to
+                lines.append('return {},rb,RUNNING'.format(pc))
+            else:
+                emit_goto(lines,pc)
+                successors.append(pc)
+            break
+
+        else:
+            lines.append('return {},rb,HALTED'.format(pc))
+            pc += 1
+            break
+
+    return lines,successors
+
+def emit_dispatch(lines,starts,bodies,depth):
+    # binary search over the start pcs of the basic blocks, leaving the
+    # region for any other pc
+    pad = '    '*depth
+    if len(starts) == 1:
+        lines.append(pad+'if pc == {}:'.format(starts[0]))
+        lines += [pad+'    '+line for line in bodies[starts[0]]]
+        lines.append(pad+'return pc,rb,RUNNING')
+        return
+    mid = len(starts)//2
+    lines.append(pad+'if pc < {}:'.format(starts[mid]))
+    emit_dispatch(lines,starts[:mid],bodies,depth+1)
+    emit_dispatch(lines,starts[mid:],bodies,depth)
+
+def generate_block(computer,entry_pc):
+    # (source,spans of constant code) of the region at entry_pc, or
+    # (None,None) if entry_pc is not a valid instruction
+    bodies = {}
+    spans = []
+    worklist = [entry_pc]
+    while worklist and len(bodies) < MAX_REGION_BLOCKS:
+        pc = worklist.pop()
+        if pc in bodies or (pc != entry_pc and pc in computer.blocks):
+            # leave compiled code to its own block
+            continue
+        lines,successors = generate_basic_block(computer,pc,spans)
+        if lines is None:
+            if pc == entry_pc:
+                return None,None
+            continue
+        bodies[pc] = lines
+        worklist += successors
+
+    lines = ['def block(read,write,code_map,invalidate,rb,input_queue,output_queue):',
+             '    pc = {}'.format(entry_pc),
+             '    while True:']
+    emit_dispatch(lines,sorted(bodies),bodies,2)
+
+    return '\n'.join(lines)+'\n', tuple(sorted(set(spans)))
+
+def code_words(mem,spans):
+    return tuple(word for start,end in spans for word in mem.slice(start,end))
+
+def lookup_block(computer,entry_pc):
+    volatile_code = computer.volatile_code
+    for spans,variants in compiled_blocks.get(entry_pc,()):
+        if volatile_code and any(addr in volatile_code for start,end in spans for addr in range(start,end)):
+            # compiled with constants that this computer has seen change
+            continue
+        block = variants.get(code_words(computer.mem,spans))
+        if block is not None:
+            return block,spans
+    return None,None
+
+def share_block(computer,entry_pc,spans,block):
+    layouts = compiled_blocks.setdefault(entry_pc,[])
+    if sum(len(variants) for _,variants in layouts) >= MAX_SHARED_VARIANTS:
+        return
+    for layout_spans,variants in layouts:
+        if layout_spans == spans:
+            break
+    else:
+        variants = {}
+        layouts.append((spans,variants))
+    variants[code_words(computer.mem,spans)] = block
+
+def compile_block(computer,entry_pc):
+    # the block at entry_pc, or None if it is still cold or not valid code
+    block,spans = lookup_block(computer,entry_pc)
+
+    if block is None:
+        heat = computer.heat.get(entry_pc,0)+1
+        computer.heat[entry_pc] = heat
+        if heat < HOT_THRESHOLD:
+            return None
+
+        source,spans = generate_block(computer,entry_pc)
+        if source is None:
+            if entry_pc in computer.volatile_code:
+                computer.modified_code.add(entry_pc)
+            return None
+
+        namespace = {'RUNNING':RUNNING, 'WAITING':WAITING, 'HALTED':HALTED}
+        exec(compile(source,'<intcode block {}>'.format(entry_pc),'exec'),namespace)
+        block = namespace['block']
+
+        share_block(computer,entry_pc,spans,block)
+
+    for start,end in spans:
+        computer.register_code(entry_pc,start,end)
+
+    return block
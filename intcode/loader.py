@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)loader.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+# Loads program files into memory images, parsing each distinct program only
+# once. Images are cached by the hash of the file contents, in-process and
+# optionally on disk as raw 64-bit words. An image is shared by everyone
+# loading the same program, so it must not be written to. Computers made from
+# it get their own copy of the flat store, and share its sparse pages until
+# written.
+
+import hashlib
+import os
+from array import array
+
+from .memory import Memory
+
+# content hash -> image
+images = {}
+
+def load_program(fname,cache_dir=None):
+    data = open(fname,'rb').read()
+    key = hashlib.sha1(data).hexdigest()
+
+    image = images.get(key)
+    if image is None:
+        cache_file = os.path.join(cache_dir,key+'.bin') if cache_dir else None
+        if cache_file and os.path.exists(cache_file):
+            image = read_image(cache_file)
+        else:
+            image = Memory([int(c) for c in data.split(b',')])
+            if cache_file:
+                write_image(cache_file,image)
+        images[key] = image
+
+    return image
+
+def read_image(fname):
+    words = array('q')
+    with open(fname,'rb') as f:
+        words.frombytes(f.read())
+    return Memory(words)
+
+def write_image(fname,image):
+    if not isinstance(image.state,array):
+        # values beyond 64 bits, not worth caching
+        return
+    os.makedirs(os.path.dirname(fname),exist_ok=True)
+    # write and rename, so that readers never see a partial file
+    tmp_fname = '{}.{}'.format(fname,os.getpid())
+    with open(tmp_fname,'wb') as f:
+        f.write(image.state[:image.length].tobytes())
+    os.replace(tmp_fname,fname)
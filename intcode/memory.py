@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)memory.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+from array import array
+
+# addresses below this are kept in one flat store, the rest in sparse pages
+MAX_FLAT_SIZE = 1 << 20
+
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+def make_store(data):
+    # compact 64-bit store, falling back to a list of python ints if any
+    # value does not fit
+    try:
+        return array('q',data)
+    except OverflowError:
+        return list(data)
+
+class Memory:
+    def __init__(self,state):
+        self.state = make_store(state)
+        # number of addresses in use, the flat store may be larger
+        self.length = len(self.state)
+        # sparse pages, page index -> store
+        self.pages = {}
+        # indices of pages shared with a copy, to be copied before writing
+        self.shared_pages = set()
+
+    def read(self,addr):
+        if addr < len(self.state):
+            return self.state[addr]
+        else:
+            return self.read_far(addr)
+
+    def write(self,addr,data):
+        if addr < len(self.state):
+            try:
+                self.state[addr] = data
+            except OverflowError:
+                self.widen()
+                self.state[addr] = data
+            if addr >= self.length:
+                self.length = addr+1
+        else:
+            self.write_far(addr,data)
+
+    def read_far(self,addr):
+        if addr < MAX_FLAT_SIZE:
+            return 0
+        page = self.pages.get(addr >> PAGE_BITS)
+        if page is None:
+            return 0
+        return page[addr & PAGE_MASK]
+
+    def write_far(self,addr,data):
+        if addr < MAX_FLAT_SIZE:
+            # grow by doubling, to amortize the cost of reallocation
+            capacity = min(max(2*len(self.state),addr+1),MAX_FLAT_SIZE)
+            self.state.extend(make_store([0])*(capacity-len(self.state)))
+            self.write(addr,data)
+            return
+
+        idx = addr >> PAGE_BITS
+        page = self.pages.get(idx)
+        if page is None:
+            page = make_store([0])*PAGE_SIZE
+            self.pages[idx] = page
+        elif idx in self.shared_pages:
+            page = page[:]
+            self.pages[idx] = page
+            self.shared_pages.discard(idx)
+        try:
+            page[addr & PAGE_MASK] = data
+        except OverflowError:
+            page = list(page)
+            self.pages[idx] = page
+            page[addr & PAGE_MASK] = data
+
+    def widen(self):
+        # a value did not fit in 64 bits, switch to python ints
+        self.state = list(self.state)
+
+    def copy(self):
+        # the flat store is copied right away, which for an array is a plain
+        # memcpy, while sparse pages are shared until either side writes
+        mem = Memory.__new__(Memory)
+        mem.state = self.state[:]
+        mem.length = self.length
+        mem.pages = dict(self.pages)
+        self.shared_pages = set(self.pages)
+        mem.shared_pages = set(self.pages)
+        return mem
+
+    def reset(self,image):
+        # overwrite the contents with those of another memory
+        self.state = image.state[:]
+        self.length = image.length
+        self.pages = dict(image.pages)
+        image.shared_pages = set(image.pages)
+        self.shared_pages = set(image.pages)
+
+    def slice(self,start,end):
+        if end <= len(self.state):
+            return list(self.state[start:end])
+        return [self.read(addr) for addr in range(start,end)]
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        # contents of the flat store, sparse pages are not included
+        return iter(self.state[:self.length])
+
+    def __str__(self):
+        s = ""
+        nreps = 1
+        prev = None
+        for d in self:
+            if d == prev:
+                nreps += 1
+            elif nreps > 1:
+
+                s += " ... *{} ".format(nreps)
+                # also print the next entry
+                s += ", {}".format(d)
+                nreps = 1
+            else:
+                s += ", {}".format(d)
+
+            prev = d
+
+        return "["+s[1:].strip()+"]"
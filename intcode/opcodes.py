@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)opcodes.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+MNEMONICS = {1:'add', 2:'mul', 3:'in', 4:'out', 5:'jnz', 6:'jz', 7:'lt', 8:'eq', 9:'arb', 99:'hlt'}
+
+# number of parameters for each opcode
+NPARAMS = {1:3, 2:3, 3:1, 4:1, 5:2, 6:2, 7:3, 8:3, 9:1, 99:0}
+
+# opcodes whose last parameter is an address to write to
+OUTPUT_OPCODES = [1,2,3,7,8]
+
+# pseudo-opcodes of the fused instructions of the interpreter
+MOVE = 100       # add x,0 or mul x,1
+CMP_JUMP = 101   # lt or eq, then a conditional jump on the result
+PUSH_CALL = 102  # move, then an unconditional jump
+ARB_JUMP = 103   # adjust relative base, then an unconditional jump
+
+# instruction word -> (opcode,nparams,mode1,mode2,mode3)
+instruction_formats = {}
+
+def instruction_format(instr,pc):
+    opcode = instr % 100
+    opmode = instr // 100
+
+    if opcode not in NPARAMS:
+        raise Exception('invalid opcode {} at {}'.format(opcode, pc))
+
+    nparams = NPARAMS[opcode]
+    modes = []
+    for k in range(nparams):
+        mode = opmode % 10
+        opmode //= 10
+        if mode > 2 or (mode == 1 and k == nparams-1 and opcode in OUTPUT_OPCODES):
+            raise Exception('invalid mode {} for parameter {} at {}'.format(mode, k+1, pc))
+        modes.append(mode)
+    modes += [0]*(3-nparams)
+
+    fmt = (opcode,nparams)+tuple(modes)
+    instruction_formats[instr] = fmt
+    return fmt
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)parallel.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+# Runs independent jobs on a pool of processes. The program is shipped to
+# each worker once, and jobs are handed out in chunks. The run function
+# must be picklable, i.e. defined at the top level of a module.
+#
+# The workers are forked where the platform allows it, whatever the default
+# start method is, so they start from a copy of the caller. Elsewhere, e.g.
+# on Windows, they are spawned and import the caller's main module again,
+# so the run function must be importable from it and a calling script must
+# keep its top-level code under an if __name__ == '__main__': guard.
+
+import contextlib
+import itertools
+import multiprocessing
+import os
+
+from .batch import BatchRunner, run_to_halt
+
+DEFAULT_CHUNKSIZE = 64
+
+# the runner of the current worker process
+worker_runner = None
+
+def init_worker(prog,run,jit):
+    global worker_runner
+    worker_runner = BatchRunner(prog,run,jit)
+
+def run_chunk(chunk):
+    return chunk,[worker_runner.run(job) for job in chunk]
+
+def chunked(jobs,chunksize):
+    it = iter(jobs)
+    while True:
+        chunk = list(itertools.islice(it,chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+def pool_context():
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+def imap_chunks(prog,jobs,run,jit,processes,chunksize):
+    # yields (chunk of jobs, chunk of results) in order
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    chunks = chunked(jobs,chunksize)
+
+    if processes == 1:
+        runner = BatchRunner(prog,run,jit)
+        for chunk in chunks:
+            yield chunk,[runner.run(job) for job in chunk]
+        return
+
+    # leaving the pool terminates the workers, also when the caller stops
+    # iterating early
+    with pool_context().Pool(processes,init_worker,(list(prog),run,jit)) as pool:
+        for chunk,results in pool.imap(run_chunk,chunks):
+            yield chunk,results
+
+def parallel_map(prog,jobs,run=run_to_halt,jit=False,processes=None,chunksize=DEFAULT_CHUNKSIZE):
+    results = []
+    with contextlib.closing(imap_chunks(prog,jobs,run,jit,processes,chunksize)) as chunks:
+        for chunk,chunk_results in chunks:
+            results += chunk_results
+    return results
+
+def parallel_find(prog,jobs,predicate,run=run_to_halt,jit=False,processes=None,chunksize=DEFAULT_CHUNKSIZE):
+    # first (job,result) in job order for which predicate(result) holds, or
+    # None. The remaining work is cancelled once it is found.
+    with contextlib.closing(imap_chunks(prog,jobs,run,jit,processes,chunksize)) as chunks:
+        for chunk,chunk_results in chunks:
+            for job,result in zip(chunk,chunk_results):
+                if predicate(result):
+                    return job,result
+    return None
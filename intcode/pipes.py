@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)pipes.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+# The computers read from and write to collections.deque pipes, so values
+# are consumed from the front in constant time. Values are added in bulk
+# with pipe.extend(), and taken out in bulk with the helpers below.
+
+def drain(pipe,n=None):
+    # remove and return the first n values of a pipe, or all of them
+    if n is None:
+        values = list(pipe)
+        pipe.clear()
+        return values
+    return [pipe.popleft() for i in range(n)]
+
+def drain_records(pipe,size):
+    # remove and return all complete records of size values, as tuples
+    records = []
+    popleft = pipe.popleft
+    while len(pipe) >= size:
+        records.append(tuple([popleft() for i in range(size)]))
+    return records
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @(#)profiler.py
+# @author Karl Ljungkvist <k.ljungkvist@gmail.com>
+
+# Opt-in execution profile. A computer with a profiler set runs through the
+# instrumented interpreter below instead of the regular one, so computers
+# without one pay nothing for it.
+
+from collections import Counter
+
+from .opcodes import MNEMONICS
+from .jit import RUNNING, WAITING, HALTED
+
+class Profiler:
+    def __init__(self):
+        self.pc_counts = Counter()
+        self.opcode_counts = Counter()
+        self.pc_opcodes = {}
+        # pc of conditional jump -> [taken, not taken]
+        self.branches = {}
+        # data accesses per address, instruction fetches not included
+        self.reads = Counter()
+        self.writes = Counter()
+
+    def ninstructions(self):
+        return sum(self.opcode_counts.values())
+
+    def report(self,n=20):
+        lines = []
+        total = self.ninstructions()
+        lines.append("Executed {} instructions".format(total))
+
+        lines.append("")
+        lines.append("{:>8s} {:>12s} {:>7s}".format("opcode","count","share"))
+        for opcode,count in self.opcode_counts.most_common():
+            lines.append("{:>8s} {:12d} {:6.1f}%".format(MNEMONICS[opcode],count,100*count/total))
+
+        lines.append("")
+        lines.append("{:>8s} {:>12s} {:>7s}".format("pc","count","share"))
+        for pc,count in self.pc_counts.most_common(n):
+            lines.append("{:8d} {:12d} {:6.1f}%".format(pc,count,100*count/total))
+
+        lines.append("")
+        lines.append("{:>8s} {:>6s} {:>12s} {:>12s} {:>7s}".format("pc","op","taken","not taken","ratio"))
+        branches = sorted(self.branches.items(),key=lambda b: -sum(b[1][1]))
+        for pc,(opcode,(taken,not_taken)) in branches[:n]:
+            lines.append("{:8d} {:>6s} {:12d} {:12d} {:6.1f}%".format(
+                pc,MNEMONICS[opcode],taken,not_taken,100*taken/(taken+not_taken)))
+
+        for title,counts in [("reads",self.reads),("writes",self.writes)]:
+            lines.append("")
+            lines.append("{:>8s} {:>12s}".format("addr",title))
+            for addr,count in counts.most_common(n):
+                lines.append("{:8d} {:12d}".format(addr,count))
+
+        return "\n".join(lines)
+
+    def write_folded(self,fname):
+        # one line per pc in the folded stack format of flamegraph.pl
+        with open(fname,'w') as f:
+            for pc,count in sorted(self.pc_counts.items()):
+                f.write("intcode;{};pc_{} {}\n".format(MNEMONICS[self.pc_opcodes[pc]],pc,count))
+
+def execute_profiled(computer, input_queue, output_queue, max_outputs=None):
+    prof = computer.profiler
+    mem = computer.mem
+    pc_counts = prof.pc_counts
+    opcode_counts = prof.opcode_counts
+    reads = prof.reads
+    writes = prof.writes
+
+    pc = computer.pc
+    rb = computer.relative_base
+
+    def read(mode,arg):
+        if mode == 1:
+            return arg
+        addr = arg if mode == 0 else rb+arg
+        reads[addr] += 1
+        return mem.read(addr)
+
+    def write(mode,arg,data):
+        addr = arg if mode == 0 else rb+arg
+        writes[addr] += 1
+        computer.write(addr,data)
+
+    while True:
+        entry = computer.decoded.get(pc)
+        if entry is None:
+            computer.pc = pc
+            entry = computer.decode(pc)
+
+        opcode,m1,a1,m2,a2,m3,a3 = entry
+
+        if opcode == 3 and len(input_queue) == 0:
+            # waiting for input...
+            status = WAITING
+            break
+
+        pc_counts[pc] += 1
+        opcode_counts[opcode] += 1
+        prof.pc_opcodes[pc] = opcode
+
+        if opcode == 1:
+            write(m3,a3,read(m1,a1)+read(m2,a2))
+            pc += 4
+        elif opcode == 2:
+            write(m3,a3,read(m1,a1)*read(m2,a2))
+            pc += 4
+        elif opcode == 7:
+            write(m3,a3,1 if read(m1,a1)<read(m2,a2) else 0)
+            pc += 4
+        elif opcode == 8:
+            write(m3,a3,1 if read(m1,a1)==read(m2,a2) else 0)
+            pc += 4
+        elif opcode == 5 or opcode == 6:
+            taken = (read(m1,a1) != 0) == (opcode == 5)
+            counts = prof.branches.setdefault(pc,(opcode,[0,0]))[1]
+            if taken:
+                counts[0] += 1
+                pc = read(m2,a2)
+            else:
+                counts[1] += 1
+                pc += 3
+        elif opcode == 3:
+            write(m1,a1,input_queue.popleft())
+            pc += 2
+        elif opcode == 4:
+            output_queue.append(read(m1,a1))
+            pc += 2
+            if max_outputs is not None:
+                max_outputs -= 1
+                if max_outputs == 0:
+                    status = RUNNING
+                    break
+        elif opcode == 9:
+            rb += read(m1,a1)
+            pc += 2
+        else:
+            computer.halted = True
+            status = HALTED
+            break
+
+    computer.pc = pc
+    computer.relative_base = rb
+    return status